@@ -0,0 +1,181 @@
+"""
+Check of the vectorized completion of the table (CellsExtractor.__complete_table) against the
+list based implementation it replaced: output must be identical on random layouts and on grids of images
+from 'examples data'; speed of both implementations is measured on synthetic 100x100 grids.
+
+Run from the root of the repository:
+    python -m benchmarks.complete_table
+Exit code is 1 if outputs differ.
+"""
+import argparse
+import copy
+import glob
+import os
+import sys
+import time
+
+import numpy as np
+
+from benchmarks.grid_engines import EXAMPLES_DIR, read_image
+from table_reader.cells_extractor import CellsExtractor
+
+
+def reference_complete_table(columns_list: list) -> list:
+    """
+    This function is the list based implementation of completion of the table, it is kept only for comparison
+    """
+    new_columns_list = [[] for i in range(len(columns_list))]
+    cache = [[] for i in range(len(columns_list))]
+
+    # add to the end tuple with -1 so that the lengths columns are equal (need for numpy)
+    def supplement(l, m):
+        for i, c in enumerate(l):
+            if (k := len(c)) < m:
+                l[i] = l[i] + [(-1, -1, -1, -1)] * (m - k)
+        return l
+
+    max_len_col = len(max(columns_list, key=len))
+    columns_list = supplement(columns_list, max_len_col)
+
+    # for columns slice
+    columns_list = np.array(columns_list)
+
+    for idx in range(max_len_col):
+        slice_ = columns_list[:, idx]
+        # find upper cell on idx level
+        _, up_y, _, h = min(
+            list(filter(lambda x: x[0] != -1, slice_)),
+            key=lambda x: x[1])  # upper cell
+        eps = h // 2
+
+        # i th element of slice match i th column
+        for index, cell in enumerate(slice_):
+            cell = tuple(cell)
+            x, y, w, _ = cell
+            # if current cell locate on one line with upper cell on image, add her in new list
+            if up_y <= y <= up_y + eps:
+                new_columns_list[index].append(cell)
+            # if current cell locate on other line on image
+            else:
+                # extract fit cell
+                cache_val = list(filter(lambda x: up_y <= x[1] <= up_y + eps, cache[index]))
+                if len(cache_val) == 0:
+                    if x != -1:
+                        new_columns_list[index].append((x, up_y, w, h))
+                        cache[index].append(cell)
+                    else:
+                        x, _, w, _ = columns_list[index][0]  # get some cell
+                        new_columns_list[index].append((x, up_y, w, h))
+                else:
+                    # if fit cell was in cache, extract her
+                    cache_val = tuple(cache_val[0])
+                    new_columns_list[index].append(cache_val)
+                    cache[index].remove(cache_val)
+
+    return new_columns_list
+
+
+def complete_table(extractor: CellsExtractor, columns_list: list) -> np.array:
+    # private method is called directly, it is the only part of the pipeline which is compared
+    return extractor._CellsExtractor__complete_table(columns_list).cells
+
+
+def random_layout(rng: np.random.Generator, n_cols: int, n_rows: int, drop: float, jitter: int = 3) -> list:
+    """
+    This function return list of columns of grid with n_cols x n_rows cells, where drop part of cells are missing
+    and y of cells are shifted on up to jitter pixels, like cells found on real image
+    """
+    widths = rng.integers(40, 200, n_cols)
+    heights = rng.integers(20, 60, n_rows)
+    xs = np.concatenate([[0], np.cumsum(widths)[:-1]])
+    ys = np.concatenate([[0], np.cumsum(heights)[:-1]])
+    columns_list = []
+    for i in range(n_cols):
+        keep = rng.random(n_rows) >= drop
+        keep[rng.integers(n_rows)] = True
+        column = [(int(xs[i]), int(ys[j] + rng.integers(0, jitter + 1)), int(widths[i]), int(heights[j]))
+                  for j in np.flatnonzero(keep)]
+        columns_list.append(sorted(column, key=lambda cell: cell[1]))
+    return columns_list
+
+
+def same(extractor: CellsExtractor, columns_list: list) -> bool:
+    expected = np.array(reference_complete_table(copy.deepcopy(columns_list)))
+    result = complete_table(extractor, copy.deepcopy(columns_list))
+    return expected.shape == result.shape and np.array_equal(expected, result)
+
+
+def example_layouts() -> list:
+    """
+    This function return (file, columns) -- input of completion of the table for every image in 'examples data'
+    """
+    layouts = []
+    paths = sorted(glob.glob(os.path.join(EXAMPLES_DIR, '*.jp*g')) + glob.glob(os.path.join(EXAMPLES_DIR, '*.png')))
+    for path in paths:
+        for engine in ('contours', 'components'):
+            extractor = CellsExtractor(cells_engine=engine)
+            captured = []
+
+            def capture(columns_list, extractor=extractor, captured=captured):
+                captured.append(copy.deepcopy([[tuple(map(int, cell)) for cell in col] for col in columns_list]))
+                return CellsExtractor._CellsExtractor__complete_table(extractor, columns_list)
+
+            # instance attribute is found before method of class, so input of the step is captured
+            extractor._CellsExtractor__complete_table = capture
+            try:
+                extractor.extract_cells(read_image(path))
+            except ValueError:
+                continue
+            layouts += [(f'{os.path.basename(path)} ({engine})', columns) for columns in captured]
+    return layouts
+
+
+def best_time(func: callable, repeat: int) -> float:
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--layouts', type=int, default=2000, help='number of random layouts to compare')
+    parser.add_argument('--repeat', type=int, default=5, help='number of runs, the best time is reported')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    extractor = CellsExtractor()
+    rng = np.random.default_rng(args.seed)
+    failed = 0
+
+    for i in range(args.layouts):
+        columns_list = random_layout(rng, int(rng.integers(1, 15)), int(rng.integers(1, 30)),
+                                     drop=float(rng.uniform(0, 0.5)), jitter=int(rng.integers(0, 30)))
+        if not same(extractor, columns_list):
+            failed += 1
+            print(f'random layout {i}: outputs differ')
+    print(f'random layouts: {args.layouts - failed}/{args.layouts} identical')
+
+    for name, columns_list in example_layouts():
+        ok = same(extractor, columns_list)
+        failed += not ok
+        print(f'{name[:55]:55} {len(columns_list):3} columns  {"identical" if ok else "DIFFERENT"}')
+
+    print(f'\n{"100x100, missing":16} {"lists, s":>9} {"numpy, s":>9} {"speedup":>8}')
+    for drop in (0.0, 0.05, 0.2, 0.5):
+        columns_list = random_layout(np.random.default_rng(args.seed), 100, 100, drop=drop)
+        # every implementation get columns in form which clustering gave it: lists of tuples and arrays
+        arrays = [np.array(col, dtype=np.int64).reshape(-1, 4) for col in columns_list]
+        # reference replace columns in outer list, so only outer list is copied
+        reference = best_time(lambda: reference_complete_table(list(columns_list)), args.repeat)
+        vectorized = best_time(lambda: complete_table(extractor, arrays), args.repeat)
+        print(f'{drop:16.0%} {reference:9.4f} {vectorized:9.4f} {reference / vectorized:7.1f}x')
+
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,67 @@
+"""
+Head-to-head comparison of grid engines of CellsExtractor on images from 'examples data'.
+
+Run from the root of the repository:
+    python -m benchmarks.grid_engines
+"""
+import argparse
+import glob
+import os
+import time
+
+import cv2
+import numpy as np
+
+from table_reader.cells_extractor import CellsExtractor
+
+EXAMPLES_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'examples data')
+
+
+def read_image(path: str) -> np.array:
+    # cv2.imread can't open paths with not ascii symbols on some platforms
+    return cv2.imdecode(np.fromfile(path, dtype=np.uint8), cv2.IMREAD_COLOR)
+
+
+def compare(path: str, repeat: int = 3) -> dict:
+    img = read_image(path)
+    report = {'file': os.path.basename(path)}
+    grids = {}
+    for engine in ('hough', 'projection'):
+        extractor = CellsExtractor(grid_engine=engine)
+        page = extractor.prepare_page(img)
+        best = None
+        for _ in range(repeat):
+            start = time.perf_counter()
+            try:
+                grid = extractor.extract_cells(page)
+            except ValueError:
+                grid = None
+            elapsed = time.perf_counter() - start
+            best = elapsed if best is None else min(best, elapsed)
+        grids[engine] = grid
+        report[engine] = {'seconds': round(best, 4),
+                          'shape': None if grid is None else (grid.n_cols, grid.n_rows)}
+
+    hough, projection = grids['hough'], grids['projection']
+    if hough is not None and projection is not None and hough.cells.shape == projection.cells.shape:
+        report['mean_iou'] = round(float(hough.iou(projection).mean()), 3)
+    else:
+        report['mean_iou'] = None
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--repeat', type=int, default=3, help='number of runs, the best time is reported')
+    args = parser.parse_args()
+
+    paths = sorted(glob.glob(os.path.join(EXAMPLES_DIR, '*.jp*g')) + glob.glob(os.path.join(EXAMPLES_DIR, '*.png')))
+    print(f'{"file":45} {"hough, s":>9} {"shape":>9} {"projection, s":>14} {"shape":>9} {"iou":>6}')
+    for path in paths:
+        r = compare(path, repeat=args.repeat)
+        print(f'{r["file"][:45]:45} {r["hough"]["seconds"]:9} {str(r["hough"]["shape"]):>9} '
+              f'{r["projection"]["seconds"]:14} {str(r["projection"]["shape"]):>9} {str(r["mean_iou"]):>6}')
+
+
+if __name__ == '__main__':
+    main()
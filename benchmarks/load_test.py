@@ -0,0 +1,112 @@
+"""
+Load test of table reader service (table_reader.service) with images from 'examples data'.
+Every client send file, poll its job until it is finished and send next file,
+rejected files (429) are sent again after pause. Latency is time from the first send to finished job.
+
+Start the service and run from the root of the repository:
+    python -m table_reader.service --port 8000
+    python -m benchmarks.load_test --url http://127.0.0.1:8000 --clients 8 --requests 64
+To see effect of shared batches, run the test again with service started with --no-batcher
+and compare throughput and latency.
+"""
+import argparse
+import glob
+import http.client
+import json
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlparse
+
+import numpy as np
+
+from benchmarks.grid_engines import EXAMPLES_DIR
+
+
+def _request(url, method: str, path: str, body: bytes = None) -> tuple:
+    connection = http.client.HTTPConnection(url.hostname, url.port or 80, timeout=600)
+    try:
+        connection.request(method, path, body=body,
+                           headers={'Content-Type': 'application/octet-stream'} if body is not None else {})
+        response = connection.getresponse()
+        return response.status, json.loads(response.read())
+    finally:
+        connection.close()
+
+
+def run_job(url, body: bytes, poll: float) -> dict:
+    start = time.perf_counter()
+    rejected = 0
+    while True:
+        status, answer = _request(url, 'POST', '/jobs', body)
+        if status != 429:
+            break
+        rejected += 1
+        time.sleep(poll * 10)
+    if status != 202:
+        return {'status': 'error', 'error': answer.get('error'), 'rejected': rejected,
+                'latency': time.perf_counter() - start}
+
+    while True:
+        time.sleep(poll)
+        _, job = _request(url, 'GET', f'/jobs/{answer["id"]}')
+        if job['status'] in ('done', 'error'):
+            return {'status': job['status'], 'error': job.get('error'), 'rejected': rejected,
+                    'latency': time.perf_counter() - start}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--url', default='http://127.0.0.1:8000')
+    parser.add_argument('--clients', type=int, default=8, help='number of concurrent clients')
+    parser.add_argument('--requests', type=int, default=64, help='total number of files')
+    parser.add_argument('--poll', type=float, default=0.05, help='seconds between status requests')
+    args = parser.parse_args()
+
+    url = urlparse(args.url)
+    paths = sorted(glob.glob(os.path.join(EXAMPLES_DIR, '*.jp*g')) + glob.glob(os.path.join(EXAMPLES_DIR, '*.png')))
+    files = []
+    for path in paths:
+        with open(path, 'rb') as f:
+            files.append(f.read())
+
+    counter = iter(range(args.requests))
+    lock = threading.Lock()
+
+    def client():
+        results = []
+        while True:
+            with lock:
+                i = next(counter, None)
+            if i is None:
+                return results
+            results.append(run_job(url, files[i % len(files)], args.poll))
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.clients) as executor:
+        results = [r for rs in executor.map(lambda _: client(), range(args.clients)) for r in rs]
+    seconds = time.perf_counter() - start
+
+    latency = np.array([r['latency'] for r in results if r['status'] == 'done'])
+    errors = [r for r in results if r['status'] != 'done']
+    print(f'{len(results)} files by {args.clients} clients in {seconds:.1f} s, {len(results) / seconds:.2f} files/s')
+    print(f'done: {len(latency)}, errors: {len(errors)}, rejected with 429: {sum(r["rejected"] for r in results)}')
+    if len(latency) > 0:
+        p50, p99 = np.percentile(latency, [50, 99])
+        print(f'latency p50: {p50:.2f} s, p99: {p99:.2f} s, max: {latency.max():.2f} s')
+    for r in errors[:5]:
+        print(f'error: {r["error"]}')
+    _, health = _request(url, 'GET', '/health')
+    batcher = health.pop('batcher', None)
+    print(f'service: {health}')
+    if batcher is None:
+        print('shared batches: off (service started with --no-batcher)')
+    else:
+        print(f'shared batches: {batcher["batches"]}, crops in batch: {batcher["mean_batch"]:.1f}, '
+              f'requests in batch: {batcher["mean_requests"]:.2f}, '
+              f'recognizer: {batcher["seconds"]:.1f} s, {batcher["crops_per_second"]:.0f} crops/s')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,178 @@
+"""
+Per-stage benchmark of TableReader.read on files from 'examples data' (images and pdf) in simple and scan modes.
+Every case runs in a fresh process, models are loaded before timing.
+
+Run from the root of the repository:
+    python -m benchmarks.pipeline --output bench.json
+    python -m benchmarks.pipeline --output new.json --baseline bench.json --threshold 0.1
+
+With --baseline the exit code is 1 if some case or stage became slower than the threshold allows.
+"""
+import argparse
+import datetime
+import glob
+import json
+import multiprocessing
+import os
+import platform
+import subprocess
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from benchmarks.grid_engines import EXAMPLES_DIR, read_image
+
+STAGES = ('align', 'threshold', 'morphology', 'hough', 'rulings', 'contours', 'clustering', 'completion',
+          'ocr_detect', 'ocr_recognize', 'dataframe')
+METHODS = ('simple', 'scan')
+
+
+def _peak_rss_mb() -> float or None:
+    try:
+        import resource
+    except ImportError:
+        # there is no resource module on Windows
+        return None
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is given in bytes on macOS and in kilobytes on Linux
+    return rss / 2 ** 20 if sys.platform == 'darwin' else rss / 2 ** 10
+
+
+def run_case(path: str, method: str, repeat: int) -> dict:
+    """
+    This function read one file several times and return timings of the best run
+    """
+    from table_reader.table_process import TableReader
+    from table_reader.tracing import tracer
+
+    reader = TableReader(method=method)
+    reader.cell_reader.warm_up()
+
+    is_pdf = path.lower().endswith('.pdf')
+    if is_pdf:
+        with open(path, 'rb') as f:
+            file = f.read()
+    else:
+        file = read_image(path)
+
+    report = {'file': os.path.basename(path), 'method': method}
+    best = None
+    for _ in range(repeat):
+        with tracer.collect() as records:
+            start = time.perf_counter()
+            try:
+                reader.read(file, is_pdf=is_pdf)
+            except ValueError as e:
+                report['error'] = str(e)
+                break
+            seconds = time.perf_counter() - start
+        if best is None or seconds < best[0]:
+            best = (seconds, list(records))
+
+    report['peak_rss_mb'] = _peak_rss_mb()
+    if best is None:
+        return report
+
+    seconds, records = best
+    pages = [r for r in records if r['name'] == 'page']
+    cells = sum(r['counts'].get('cells', 0) for r in pages)
+    stages = dict.fromkeys(STAGES, 0.0)
+    for r in records:
+        if r['name'] in stages:
+            stages[r['name']] += r['seconds']
+
+    report.update({'seconds': seconds,
+                   'pages': len(pages),
+                   'cells': cells,
+                   'pages_per_min': 60 * len(pages) / seconds,
+                   'cells_per_sec': cells / seconds,
+                   'stages': stages})
+    return report
+
+
+def _git_commit() -> str or None:
+    try:
+        return subprocess.run(['git', 'rev-parse', 'HEAD'], capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(report: dict, baseline: dict, threshold: float, min_seconds: float = 0.01) -> list:
+    """
+    This function return list of regressions: cases and stages which are slower than in baseline
+    more than threshold (relative), stages faster than min_seconds in both runs are ignored as noise
+    """
+    old_cases = {(case['file'], case['method']): case for case in baseline['cases']}
+    regressions = []
+    for case in report['cases']:
+        old = old_cases.get((case['file'], case['method']))
+        if old is None or 'seconds' not in old or 'seconds' not in case:
+            continue
+        pairs = [('total', old['seconds'], case['seconds'])]
+        pairs += [(name, old['stages'].get(name, 0.0), value) for name, value in case['stages'].items()]
+        for name, old_value, new_value in pairs:
+            if max(old_value, new_value) < min_seconds:
+                continue
+            if new_value > old_value * (1 + threshold):
+                regressions.append({'file': case['file'], 'method': case['method'], 'stage': name,
+                                    'baseline': old_value, 'current': new_value})
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--repeat', type=int, default=1, help='number of runs, the best run is reported')
+    parser.add_argument('--methods', nargs='+', default=list(METHODS), choices=METHODS)
+    parser.add_argument('--output', default='benchmark.json', help='path of JSON file with results')
+    parser.add_argument('--baseline', default=None, help='JSON file of other run to compare with')
+    parser.add_argument('--threshold', type=float, default=0.1, help='allowed relative slowdown')
+    args = parser.parse_args()
+
+    paths = sorted(glob.glob(os.path.join(EXAMPLES_DIR, '*.jp*g')) + glob.glob(os.path.join(EXAMPLES_DIR, '*.png'))
+                   + glob.glob(os.path.join(EXAMPLES_DIR, '*.pdf')))
+
+    cases = []
+    print(f'{"file":45} {"method":>7} {"pages":>6} {"total, s":>9} {"pages/min":>10} {"cells/s":>8} {"rss, MB":>8}')
+    for path in paths:
+        for method in args.methods:
+            # fresh process for every case, so peak memory of one case doesn't hide in other
+            with ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context('spawn')) as executor:
+                case = executor.submit(run_case, path, method, args.repeat).result()
+            cases.append(case)
+            rss = case['peak_rss_mb']
+            if 'error' in case:
+                print(f'{case["file"][:45]:45} {method:>7} error: {case["error"]}')
+                continue
+            print(f'{case["file"][:45]:45} {method:>7} {case["pages"]:6} {case["seconds"]:9.2f} '
+                  f'{case["pages_per_min"]:10.1f} {case["cells_per_sec"]:8.1f} '
+                  f'{"-" if rss is None else f"{rss:.0f}":>8}')
+
+    report = {'meta': {'commit': _git_commit(),
+                       'python': platform.python_version(),
+                       'platform': platform.platform(),
+                       'processor': platform.processor(),
+                       'cpu_count': os.cpu_count(),
+                       'timestamp': datetime.datetime.now().isoformat(timespec='seconds'),
+                       'repeat': args.repeat},
+              'cases': cases}
+    with open(args.output, 'w', encoding='utf-8') as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+
+    print(f'\n{"stage":15} {"seconds":>9}')
+    for name in STAGES:
+        print(f'{name:15} {sum(case.get("stages", {}).get(name, 0.0) for case in cases):9.2f}')
+
+    if args.baseline is not None:
+        with open(args.baseline, encoding='utf-8') as f:
+            baseline = json.load(f)
+        regressions = compare(report, baseline, threshold=args.threshold)
+        for r in regressions:
+            print(f'REGRESSION {r["file"]} [{r["method"]}] {r["stage"]}: '
+                  f'{r["baseline"]:.3f} s -> {r["current"]:.3f} s')
+        if regressions:
+            sys.exit(1)
+        print(f'No regressions against {args.baseline} (threshold {args.threshold:.0%})')
+
+
+if __name__ == '__main__':
+    main()
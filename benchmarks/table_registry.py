@@ -0,0 +1,83 @@
+"""
+Check of TableRegistry with tables spilled to disk: tables are added, spilled, edited and removed,
+after every step all tables must be read back equal to expected ones. Among tables there are
+tables with the same content and different names, like one scan uploaded twice under different names.
+
+Run from the root of the repository:
+    python -m benchmarks.table_registry
+Exit code is 1 if some table is lost or changed.
+"""
+import argparse
+import sys
+import tempfile
+
+import numpy as np
+import pandas as pd
+
+from table_reader.table_registry import TableRegistry
+
+
+def make_table(rng: np.random.Generator, n_rows: int = 2000) -> pd.DataFrame:
+    return pd.DataFrame({'sort': rng.choice(['A', 'B', 'C'], n_rows),
+                         'height': rng.random(n_rows),
+                         'count': rng.integers(0, 100, n_rows)})
+
+
+def check(registry: TableRegistry, expected: dict, step: str) -> int:
+    """
+    This function read all tables of registry, return number of lost or changed tables
+    """
+    failed = 0
+    for table_id, df in expected.items():
+        try:
+            ok = registry.get(table_id).equals(df)
+        except (FileNotFoundError, KeyError) as e:
+            ok = False
+            print(f'{step}: table {table_id} is lost ({type(e).__name__})')
+        else:
+            if not ok:
+                print(f'{step}: table {table_id} is changed')
+        failed += not ok
+    return failed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(args.seed)
+    failed = 0
+    with tempfile.TemporaryDirectory() as directory:
+        # budget for one table, so every other table is spilled
+        table = make_table(rng)
+        registry = TableRegistry(max_bytes=int(table.memory_usage(deep=True).sum() * 1.5), directory=directory)
+
+        first, _ = registry.add('first', table)
+        second, _ = registry.add('second', table.copy())
+        other, _ = registry.add('other', make_table(rng))
+        expected = {first: table, second: table, other: registry.get(other)}
+        failed += check(registry, expected, 'add')
+
+        edited = table.copy()
+        edited.iloc[0, 1] = -1.0
+        registry.update(first, edited)
+        expected[first] = edited
+        failed += check(registry, expected, 'update')
+
+        # table is equal to other table again after editing
+        registry.update(first, table.copy())
+        expected[first] = table
+        failed += check(registry, expected, 'update back')
+
+        registry.remove(first)
+        del expected[first]
+        failed += check(registry, expected, 'remove')
+
+        print(f'{registry.stats()}')
+    print('ok' if failed == 0 else f'{failed} failed checks')
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -1,42 +1,75 @@
 import base64
 import io
+import time
+import uuid
 
 from pyxlsb import open_workbook as open_xlsb
 import streamlit as st
 import streamlit.components.v1 as components
 from table_reader.table_process import TableReader
-from cv2 import imdecode
-from numpy import asarray, uint8
-from io import BytesIO
+from table_reader.cache import DocumentCache
+from table_reader.column_types import keep_parse_errors, parse_errors_table
+from table_reader.export import FORMATS, export_tables
+from table_reader.jobs import JobManager
+from table_reader.table_registry import TableRegistry
+from table_reader.tracing import summarize
 import pandas as pd
 
 
 @st.cache_resource(ttl=3600)
 def load_reader():
-    return TableReader()
-
-
-@st.cache_data
-def get_dict(tablename, dataframe):
-    return {'name': tablename, 'DataFrame': dataframe}
-
-
-@st.cache_data
-def to_excel(df):
-    output = BytesIO()
-    writer = pd.ExcelWriter(output, engine='xlsxwriter')
-    df.to_excel(writer, index=False, sheet_name='Sheet1')
-    writer.close()
-    processed_data = output.getvalue()
-    return processed_data
-
-
-reader = load_reader()
-
-# list with dict {name, DataFrame}
-# here contain all data who was uploaded and processed in one session
-if 'table_list_of_dict' not in st.session_state:
-    st.session_state['table_list_of_dict'] = []
+    # tables of already processed files are kept on disk and shared by all sessions
+    return TableReader(document_cache=DocumentCache(directory='.cache/documents'))
+
+
+@st.cache_resource
+def load_job_manager():
+    # files are read in background threads shared by all sessions, reading isn't lost on rerun
+    return JobManager(load_reader(), max_workers=2)
+
+
+def export_widget(key: str, version: str, get_tables: callable, file_name: str):
+    """
+    This function show choice of format and make file only after click,
+    file is kept in session until tables are changed (version is changed)
+    """
+    exports = st.session_state['exports']
+    col_format, col_button = st.columns(2)
+    fmt = col_format.selectbox('Format', list(FORMATS), key=f'format_{key}', label_visibility='collapsed')
+    if col_button.button('Подготовить файл', key=f'prepare_{key}'):
+        data, extension, mime = export_tables(get_tables(), fmt)
+        exports[key] = (version, fmt, data, extension, mime)
+
+    prepared = exports.get(key)
+    if prepared is not None and prepared[:2] == (version, fmt):
+        _, _, data, extension, mime = prepared
+        st.download_button(label=f'Download like {extension}', data=data,
+                           file_name=f'{file_name}.{extension}', mime=mime, key=f'download_{key}')
+    elif prepared is not None:
+        # file of old version of tables isn't needed anymore
+        del exports[key]
+
+
+job_manager = load_job_manager()
+
+# jobs of the session are found by this id after reruns
+if 'session_id' not in st.session_state:
+    st.session_state['session_id'] = uuid.uuid4().hex
+session_id = st.session_state['session_id']
+
+# here contain all tables who was uploaded and processed in one session,
+# the same tables are kept once, cold tables are moved to disk
+if 'tables' not in st.session_state:
+    st.session_state['tables'] = TableRegistry(directory='.cache/tables')
+tables = st.session_state['tables']
+
+# prepared files for download {key: (version, format, data, extension, mime)}
+if 'exports' not in st.session_state:
+    st.session_state['exports'] = {}
+
+# timing breakdown of processed files {name: DataFrame}
+if 'timings' not in st.session_state:
+    st.session_state['timings'] = {}
 
 # main
 
@@ -59,40 +92,68 @@ uploaded_files = st.file_uploader(
     "Upload your PDFs or image here and click on 'Process'",
     accept_multiple_files=True, type=['pdf', 'png', 'jpeg', 'jpg'])
 
-# process uploaded data
+show_timing = st.checkbox('Показать время обработки по этапам')
+
+# process uploaded data in background, files are read concurrently
 if st.button("Process"):
     for uploaded_file in uploaded_files:
         name, extension = uploaded_file.name.split('.')
-
-        if extension == 'pdf':
-            # all tables in one pdf document merge into one table
-            df = reader.read(uploaded_file.read(), is_pdf=True)
-        else:
-            file_bytes = asarray(bytearray(uploaded_file.read()), dtype=uint8)
-            opencv_image = imdecode(file_bytes, 1)
-            df = reader.read(opencv_image, is_pdf=False)
-
-        try:
-            # if user upload two some file pandas throw exception ValueError when compare just processed file and
-            # contained in session storage some file. If this happened, then just processed file will be ignored
-            d = get_dict(name, df)
-            if d not in st.session_state['table_list_of_dict']:
-                st.session_state['table_list_of_dict'].append(d)
-        except ValueError:
-            pass
+        # all tables in one pdf document merge into one table
+        # spans are collected only if user want to see them, otherwise tracing cost nothing
+        job_manager.submit(session_id, name, uploaded_file.read(), is_pdf=extension == 'pdf', trace=show_timing)
     uploaded_files.clear()
 
+# collect finished files into session
+for job in job_manager.pop_finished(session_id):
+    if job.status == 'error':
+        st.error(f'{job.name}: {job.error}')
+        continue
+    if job.records:
+        st.session_state['timings'][job.name] = pd.DataFrame(summarize(job.records)).fillna(0)
+
+    # if user upload two some file, then just processed file will be ignored
+    tables.add(job.name, job.result)
+
+# progress of files which are read now
+running_jobs = job_manager.jobs(session_id)
+for job in running_jobs:
+    if job.status == 'queued':
+        text = f'{job.name}: в очереди'
+    elif job.n_pages is None:
+        text = f'{job.name}: обработка'
+    else:
+        text = f'{job.name}: страница {job.pages_done}/{job.n_pages}, ячеек прочитано {job.cells_done}'
+    st.progress(job.fraction, text=text)
+
 # display processed file into expander list
-for index, val in enumerate(st.session_state['table_list_of_dict']):
-    name = val['name']
+for table_id, name in tables.items():
     with st.expander(label=name):
-        df = val['DataFrame']
-        new_df = st.data_editor(df)
-        st.session_state['table_list_of_dict'][index]['DataFrame'] = new_df
-        df_xlsx = to_excel(df)
-        st.download_button(
-            label="Download like excel",
-            data=df_xlsx,
-            file_name=f"{name}.xlsx",
-            mime="application/vnd.ms-excel"
-        )
+        df = tables.get(table_id)
+        # editor return table without attrs, not parsed cells which user didn't fill are kept
+        new_df = keep_parse_errors(df, st.data_editor(df, key=f'editor_{table_id}'))
+        if not new_df.equals(df):
+            tables.update(table_id, new_df)
+            df = new_df
+
+        errors = parse_errors_table(df)
+        if len(errors) > 0:
+            st.warning(f'Ячеек не распознано как числа: {len(errors)}. '
+                       f'Они пусты в таблице, ниже показан прочитанный текст, исправьте их в таблице')
+            st.dataframe(errors.rename(columns={'row': 'Строка', 'column': 'Столбец', 'text': 'Текст'}),
+                         hide_index=True)
+        if show_timing and name in st.session_state['timings']:
+            st.caption('Время обработки по этапам')
+            st.dataframe(st.session_state['timings'][name], hide_index=True)
+        export_widget(f'table_{table_id}', tables.fingerprint(table_id),
+                      lambda table_id=table_id, name=name: [(name, tables.get(table_id))], name)
+
+# all tables of session in one file, in excel every table is on own sheet
+if len(tables) > 1:
+    st.write('Все таблицы в одном файле')
+    export_widget('all', '|'.join(tables.fingerprint(table_id) for table_id, _ in tables.items()),
+                  lambda: [(name, tables.get(table_id)) for table_id, name in tables.items()], 'tables')
+
+# page is refreshed while files are read, so progress and results appear without user actions
+if running_jobs:
+    time.sleep(1)
+    st.rerun()
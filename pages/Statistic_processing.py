@@ -1,17 +1,25 @@
 import streamlit as st
 import pandas as pd
-import io
 
-if 'table_list_of_dict' not in st.session_state:
-    st.session_state['table_list_of_dict'] = []
+from table_reader.column_types import keep_parse_errors
+from table_reader.statistics import TableStatistics, is_numeric
+from table_reader.table_registry import TableRegistry, fingerprint
 
-if 'processed_data_list_of_dict' not in st.session_state:
-    st.session_state['processed_data_list_of_dict'] = []
 
+@st.cache_resource
+def load_statistics():
+    # statistics are kept by content of columns, so they are shared by all sessions
+    return TableStatistics()
 
-@st.cache_data
-def get_dict(tablename, dataframe):
-    return {'name': tablename, 'DataFrame': dataframe}
+
+# tables of session are shared with Image_to_table page
+if 'tables' not in st.session_state:
+    st.session_state['tables'] = TableRegistry(directory='.cache/tables')
+tables = st.session_state['tables']
+
+# ids of tables which are chosen for processing
+if 'processed_tables' not in st.session_state:
+    st.session_state['processed_tables'] = []
 
 
 # main
@@ -32,40 +40,58 @@ uploaded_files = st.file_uploader(
 with st.sidebar:
     with st.expander(label='Tables'):
         st.write('Select table who you want get statistic')
-        for idx, d in enumerate(st.session_state['table_list_of_dict']):
-            if st.checkbox(d['name'], key=idx):
-                # if user choose some table for processing? then put her in processed_list
-                # list in session storage. These tables display on main frame
-                if not (d in st.session_state['processed_data_list_of_dict']):
-                    st.session_state['processed_data_list_of_dict'].append(d)
-            else:
-                # if checkbox off, then appropriate table delete from processed_list
-                if d in st.session_state['processed_data_list_of_dict']:
-                    st.session_state['processed_data_list_of_dict'].remove(d)
+        # if user choose some table for processing, then put her id in processed list
+        # in session storage. These tables display on main frame
+        st.session_state['processed_tables'] = [table_id for table_id, name in tables.items()
+                                                if st.checkbox(name, key=f'select_{table_id}')]
 
 if st.button("Upload"):
     # load upload data in session storage
     for uploaded_file in uploaded_files:
         name = uploaded_file.name
         df = pd.read_excel(uploaded_file.getvalue())
-        try:
-            # if user upload two some file pandas throw exception ValueError when compare just processed file and
-            # contained in session storage some file. If this happened, then just processed file will be ignored
-            d = get_dict(name, df)
-            if d not in st.session_state['table_list_of_dict']:
-                st.session_state['table_list_of_dict'].append(d)
-        except ValueError:
-            pass
+        # if user upload two some file, then just processed file will be ignored
+        tables.add(name, df)
     # uploaded_files.clear()
 
 # statistic processing and display result into expander list
-for val in st.session_state['processed_data_list_of_dict']:
-    name = val['name']
-    with st.expander(label=name):
-        df = val['DataFrame']
-        st.dataframe(df)
-
-        buffer = io.StringIO()
-        df.info(buf=buffer)
-        s = buffer.getvalue()
-        st.text(s)
+statistics = load_statistics()
+for table_id in st.session_state['processed_tables']:
+    if table_id not in tables:
+        continue
+    with st.expander(label=tables.name(table_id)):
+        df = tables.get(table_id)
+        # rows can't be added or deleted, edits of cells are applied again on rerun and give the same table
+        # editor return table without attrs, not parsed cells which user didn't fill are kept
+        edited = keep_parse_errors(df, st.data_editor(df, key=f'stat_editor_{table_id}', num_rows='fixed'))
+        fp = fingerprint(edited)
+        if fp != tables.fingerprint(table_id):
+            tables.update(table_id, edited)
+        # columns are hashed once for every version of table, not changed columns keep their statistics
+        keys = statistics.keys(edited, fingerprint=fp)
+
+        tab_describe, tab_group, tab_corr = st.tabs(['Описательная статистика', 'Группировка', 'Корреляция'])
+        with tab_describe:
+            numeric, labels = statistics.describe(edited, keys)
+            if len(numeric) > 0:
+                st.dataframe(numeric)
+            if len(labels) > 0:
+                st.dataframe(labels)
+
+        numeric_columns = [name for i, name in enumerate(edited.columns) if is_numeric(edited.iloc[:, i])]
+        with tab_group:
+            group_columns = [name for name in edited.columns if name not in numeric_columns]
+            if not group_columns or not numeric_columns:
+                st.write('Для группировки нужны числовой и нечисловой столбцы')
+            else:
+                by = st.selectbox('Группировать по', group_columns, key=f'group_by_{table_id}')
+                columns = st.multiselect('Столбцы', numeric_columns, default=numeric_columns[:3],
+                                         key=f'group_columns_{table_id}')
+                if columns:
+                    st.dataframe(statistics.group_by(edited, by, columns, keys))
+
+        with tab_corr:
+            if len(numeric_columns) < 2:
+                st.write('Для корреляции нужно хотя бы два числовых столбца')
+            else:
+                st.dataframe(statistics.correlation(edited, keys).round(3))
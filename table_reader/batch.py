@@ -0,0 +1,243 @@
+"""
+Batch converter of scans of tables (pdf and images) to xlsx, csv or parquet files.
+
+Run from the root of the repository:
+    python -m table_reader.batch "scans/" --output-dir tables --format xlsx --workers 4
+    python -m table_reader.batch "scans/**/*.pdf" --output-dir tables --format parquet
+
+Finished files are written to manifest in the output directory,
+so interrupted run started again skips them and converts only the rest.
+"""
+import argparse
+import glob
+import json
+import multiprocessing
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import cv2
+import numpy as np
+
+from table_reader import export, table_process
+from table_reader.cells_extractor import CellsExtractor
+from table_reader.cells_reader import CellsReader
+from table_reader.table_process import TableReader
+from table_reader.tracing import tracer
+
+EXTENSIONS = ('.pdf', '.png', '.jpg', '.jpeg')
+MANIFEST_NAME = 'manifest.jsonl'
+
+
+def find_files(inputs: list) -> list:
+    """
+    This function return sorted absolute paths of pdf and images from directories (recursively) and glob patterns
+    """
+    paths = set()
+    for item in inputs:
+        if os.path.isdir(item):
+            candidates = glob.glob(os.path.join(item, '**', '*'), recursive=True)
+        else:
+            candidates = glob.glob(item, recursive=True)
+        for path in candidates:
+            if os.path.isfile(path) and os.path.splitext(path)[1].lower() in EXTENSIONS:
+                paths.add(os.path.abspath(path))
+    return sorted(paths)
+
+
+def output_path(path: str, root: str, output_dir: str, fmt: str) -> str:
+    """
+    This function return path of output file, structure of subdirectories of input is kept
+    """
+    relative = os.path.relpath(path, root)
+    return os.path.join(output_dir, f'{relative}.{fmt}')
+
+
+def _signature(path: str) -> dict:
+    stat = os.stat(path)
+    return {'size': stat.st_size, 'mtime': stat.st_mtime}
+
+
+class Manifest:
+    """
+    This class keep results of converted files in JSON lines file, one line per finished file,
+    the last line for file is actual. File is done if its size and modification time didn't change
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.entries = {}
+        if os.path.exists(path):
+            with open(path, encoding='utf-8') as f:
+                for line in f:
+                    try:
+                        entry = json.loads(line)
+                    except json.JSONDecodeError:
+                        # last line can be cut off, if previous run was killed
+                        continue
+                    self.entries[entry['file']] = entry
+        self.__file = open(path, 'a', encoding='utf-8')
+
+    def is_done(self, path: str, output: str) -> bool:
+        entry = self.entries.get(path)
+        return (entry is not None and entry['status'] == 'done' and os.path.exists(output)
+                and entry['size'] == _signature(path)['size'] and entry['mtime'] == _signature(path)['mtime'])
+
+    def add(self, entry: dict):
+        self.entries[entry['file']] = entry
+        self.__file.write(json.dumps(entry, ensure_ascii=False) + '\n')
+        self.__file.flush()
+
+    def close(self):
+        self.__file.close()
+
+
+def write_table(df, output: str, fmt: str):
+    """
+    This function write table via temporary file, so interrupted write doesn't leave broken output,
+    table is written like export of the page (see table_reader.export)
+    """
+    os.makedirs(os.path.dirname(output), exist_ok=True)
+    tmp_output = f'{output}.{os.getpid()}.tmp'
+    try:
+        export.write_table(os.path.splitext(os.path.basename(output))[0], df, tmp_output, fmt)
+    except BaseException:
+        if os.path.exists(tmp_output):
+            os.remove(tmp_output)
+        raise
+    os.replace(tmp_output, output)
+
+
+def convert_file(reader: TableReader, path: str, output: str, fmt: str) -> dict:
+    """
+    This function read table from file and write it, return entry of manifest
+    """
+    entry = {'file': path, 'output': output, **_signature(path)}
+    start = time.perf_counter()
+    try:
+        is_pdf = path.lower().endswith('.pdf')
+        if is_pdf:
+            with open(path, 'rb') as f:
+                file = f.read()
+        else:
+            # cv2.imread can't open paths with not ascii symbols on some platforms
+            file = cv2.imdecode(np.fromfile(path, dtype=np.uint8), cv2.IMREAD_COLOR)
+            if file is None:
+                raise ValueError('File is not an image')
+
+        with tracer.collect() as records:
+            df = reader.read(file, is_pdf=is_pdf)
+        write_table(df, output, fmt)
+
+        pages = [r for r in records if r['name'] == 'page']
+        entry.update({'status': 'done',
+                      'pages': len(pages),
+                      'cells': sum(r['counts'].get('cells', 0) for r in pages),
+                      'rows': len(df)})
+    except Exception as e:
+        # one broken scan must not stop the whole batch
+        entry.update({'status': 'error', 'error': f'{type(e).__name__}: {e}'})
+    entry['seconds'] = time.perf_counter() - start
+    return entry
+
+
+def _convert_in_worker(path: str, output: str, fmt: str) -> dict:
+    return convert_file(table_process._worker_reader, path, output, fmt)
+
+
+def run(paths: list, root: str, output_dir: str, fmt: str, reader: TableReader, workers: int = 1,
+        log: callable = print) -> dict:
+    """
+    This function convert files which aren't in manifest yet, return summary of the run
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    manifest = Manifest(os.path.join(output_dir, MANIFEST_NAME))
+    jobs = [(path, output_path(path, root, output_dir, fmt)) for path in paths]
+    todo = [(path, output) for path, output in jobs if not manifest.is_done(path, output)]
+    log(f'{len(jobs)} files found, {len(jobs) - len(todo)} already done, {len(todo)} to convert')
+
+    summary = {'files': len(jobs), 'skipped': len(jobs) - len(todo), 'done': 0, 'failed': 0,
+               'pages': 0, 'cells': 0}
+    start = time.perf_counter()
+
+    def finish(entry):
+        manifest.add(entry)
+        if entry['status'] == 'done':
+            summary['done'] += 1
+            summary['pages'] += entry['pages']
+            summary['cells'] += entry['cells']
+            log(f'[{summary["done"] + summary["failed"]}/{len(todo)}] {entry["file"]}: '
+                f'{entry["pages"]} pages, {entry["seconds"]:.1f} s')
+        else:
+            summary['failed'] += 1
+            log(f'[{summary["done"] + summary["failed"]}/{len(todo)}] {entry["file"]}: {entry["error"]}')
+
+    try:
+        if workers > 1 and len(todo) > 1:
+            n_threads = max(1, os.cpu_count() // workers)
+            with ProcessPoolExecutor(max_workers=workers,
+                                     mp_context=multiprocessing.get_context('spawn'),
+                                     initializer=table_process._init_worker,
+                                     initargs=(reader.cell_extractor, reader.cell_reader, n_threads,
+                                               reader.method)) as executor:
+                futures = [executor.submit(_convert_in_worker, path, output, fmt) for path, output in todo]
+                try:
+                    for future in as_completed(futures):
+                        finish(future.result())
+                except KeyboardInterrupt:
+                    executor.shutdown(cancel_futures=True)
+                    raise
+        else:
+            for path, output in todo:
+                finish(convert_file(reader, path, output, fmt))
+    finally:
+        manifest.close()
+
+    seconds = time.perf_counter() - start
+    summary.update({'seconds': seconds,
+                    'files_per_min': 60 * summary['done'] / seconds if seconds > 0 else 0.0,
+                    'pages_per_min': 60 * summary['pages'] / seconds if seconds > 0 else 0.0,
+                    'cells_per_sec': summary['cells'] / seconds if seconds > 0 else 0.0})
+    return summary
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('inputs', nargs='+', help='directories or glob patterns of pdf and images')
+    parser.add_argument('--output-dir', required=True, help='directory for tables and manifest')
+    parser.add_argument('--format', default='xlsx', choices=list(export.FORMATS))
+    parser.add_argument('--workers', type=int, default=1, help='number of processes, each process read one file')
+    parser.add_argument('--method', default='scan', choices=('simple', 'scan'), help='method of cells reader')
+    parser.add_argument('--lang', nargs='+', default=['ru', 'en'], help='languages of OCR model')
+    args = parser.parse_args()
+
+    if args.format == 'parquet':
+        try:
+            import pyarrow
+        except ImportError:
+            print('pyarrow is required for parquet format: pip install pyarrow')
+            sys.exit(1)
+
+    paths = find_files(args.inputs)
+    if len(paths) == 0:
+        print('No pdf or images found')
+        sys.exit(1)
+    root = os.path.commonpath([os.path.dirname(path) for path in paths])
+
+    reader = TableReader(cell_extractor=CellsExtractor(),
+                         cell_reader=CellsReader(model='easyocr', lang=args.lang),
+                         method=args.method)
+    summary = run(paths, root, args.output_dir, args.format, reader, workers=args.workers)
+
+    print(f'\nDone: {summary["done"]}, skipped: {summary["skipped"]}, failed: {summary["failed"]} '
+          f'of {summary["files"]} files')
+    print(f'{summary["pages"]} pages, {summary["cells"]} cells in {summary["seconds"]:.1f} s: '
+          f'{summary["files_per_min"]:.1f} files/min, {summary["pages_per_min"]:.1f} pages/min, '
+          f'{summary["cells_per_sec"]:.1f} cells/s')
+    if summary['failed'] > 0:
+        sys.exit(2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,153 @@
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future
+
+import numpy as np
+
+
+def read_in_groups(model: object, crops: list, batch_size: int = 16, allowlist: list = None) -> list:
+    """
+    This function sort crops by ratio of width to height and read them in batches of batch_size crops,
+    recognizer resize crops to the same height and pad them to the widest crop of the batch,
+    so crops with similar ratio in one batch waste less time on padding.
+    Return strings in order of crops
+    """
+    if len(crops) == 0:
+        return []
+    ratios = np.array([crop.shape[1] / max(crop.shape[0], 1) for crop in crops])
+    order = np.argsort(ratios, kind='stable')
+
+    strings = [''] * len(crops)
+    for start in range(0, len(crops), batch_size):
+        idx = order[start: start + batch_size]
+        read = model.read_crops([crops[i] for i in idx], allowlist=allowlist, batch_size=batch_size)
+        for i, s in zip(idx, read):
+            strings[i] = s
+    return strings
+
+
+class CropBatcher:
+    """
+    This class merge crops of cells sent by different threads into shared batches of recognizer.
+    Thread which submit crops wait until batch with its crops is read.
+    Batch is sent to recognizer when it has max_batch crops or when the oldest crops wait max_wait seconds.
+    All batches are read in one thread, so recognizer is never called by several threads at once
+    """
+
+    def __init__(self, max_batch: int = 256, max_wait: float = 0.05, batch_size: int = 16):
+        """
+        max_batch -- number of crops after which batch is sent without waiting
+        max_wait -- seconds which the oldest crops can wait for crops of other requests
+        batch_size -- batch size of recognizer, batch of crops is split into such batches of crops with similar size
+        """
+        self.max_batch = max_batch
+        self.max_wait = max_wait
+        self.batch_size = batch_size
+        self.batches = 0
+        self.crops = 0
+        self.requests = 0
+        self.seconds = 0.0
+        self.__queue = deque()
+        self.__n_queued = 0
+        self.__condition = threading.Condition()
+        self.__thread = None
+        self.__closed = False
+
+    def submit(self, model: object, crops: list, allowlist: list = None) -> list:
+        """
+        This method return strings of crops in order of crops,
+        model is reader model with method read_crops (like models of CellsReader)
+        """
+        if len(crops) == 0:
+            return []
+        future = Future()
+        key = (model.name, tuple(model.lang), tuple(allowlist) if allowlist else None)
+        with self.__condition:
+            if self.__closed:
+                raise RuntimeError('Batcher is closed')
+            if self.__thread is None:
+                self.__thread = threading.Thread(target=self.__loop, name='crop-batcher', daemon=True)
+                self.__thread.start()
+            self.__queue.append((key, model, allowlist, crops, future, time.monotonic()))
+            self.__n_queued += len(crops)
+            self.__condition.notify()
+        return future.result()
+
+    def __take_batch(self) -> list:
+        """
+        This method wait for full batch or for timeout of the oldest request,
+        then take from queue requests with the same model as the oldest request
+        """
+        with self.__condition:
+            while not self.__queue and not self.__closed:
+                self.__condition.wait()
+            if not self.__queue:
+                return []
+            while self.__n_queued < self.max_batch and not self.__closed:
+                timeout = self.__queue[0][5] + self.max_wait - time.monotonic()
+                if timeout <= 0:
+                    break
+                self.__condition.wait(timeout)
+
+            key = self.__queue[0][0]
+            batch, rest, n = [], deque(), 0
+            while self.__queue:
+                request = self.__queue.popleft()
+                # request larger than max_batch goes alone, requests are never split
+                if request[0] == key and (n == 0 or n + len(request[3]) <= self.max_batch):
+                    batch.append(request)
+                    n += len(request[3])
+                else:
+                    rest.append(request)
+            self.__queue = rest
+            self.__n_queued -= n
+            return batch
+
+    def __loop(self):
+        while True:
+            batch = self.__take_batch()
+            if not batch:
+                return
+            _, model, allowlist, _, _, _ = batch[0]
+            crops = [crop for request in batch for crop in request[3]]
+            start = time.perf_counter()
+            try:
+                strings = read_in_groups(model, crops, batch_size=self.batch_size, allowlist=allowlist)
+            except Exception as e:
+                for request in batch:
+                    request[4].set_exception(e)
+                continue
+            self.seconds += time.perf_counter() - start
+            self.batches += 1
+            self.crops += len(crops)
+            self.requests += len(batch)
+
+            # route strings back to requests
+            start = 0
+            for request in batch:
+                end = start + len(request[3])
+                request[4].set_result(strings[start:end])
+                start = end
+
+    def stats(self) -> dict:
+        """
+        This method return number of shared batches, crops and requests in them, mean number of crops
+        and requests in batch, seconds of recognition and number of crops which wait in queue
+        """
+        return {'batches': self.batches, 'crops': self.crops, 'requests': self.requests,
+                'mean_batch': self.crops / self.batches if self.batches else 0.0,
+                'mean_requests': self.requests / self.batches if self.batches else 0.0,
+                'seconds': round(self.seconds, 3),
+                'crops_per_second': self.crops / self.seconds if self.seconds else 0.0,
+                'queued': self.__n_queued}
+
+    def close(self):
+        """
+        This method read crops which are already in queue and stop thread of batcher
+        """
+        with self.__condition:
+            self.__closed = True
+            self.__condition.notify_all()
+        if self.__thread is not None:
+            self.__thread.join()
@@ -0,0 +1,318 @@
+import hashlib
+import os
+import pickle
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+import cv2
+import numpy as np
+import pandas as pd
+
+
+class _DiskStore:
+    """
+    This class keep values as files in directory,
+    when size of the directory exceed max_bytes, the least recently used files are removed
+    until size is less than low_water part of max_bytes, files which weren't used max_age seconds are removed too.
+    Size and last use time of files are kept in memory index, so directory is walked only once on start
+    """
+
+    def __init__(self, directory: str, max_bytes: int, max_age: float = None, low_water: float = 0.8):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+        self.low_water = low_water
+        self.__lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+        # path -> (size, last use time)
+        self.__index = {path: (size, used) for path, size, used in self.__files()}
+        self.__size = sum(size for size, _ in self.__index.values())
+        if self.__size > max_bytes or max_age is not None:
+            self.evict()
+
+    def __files(self) -> list:
+        """
+        This method return list of (path, size, last use time) of all stored files
+        """
+        files = []
+        for root, _, names in os.walk(self.directory):
+            for name in names:
+                if name.endswith('.tmp'):
+                    continue
+                path = os.path.join(root, name)
+                try:
+                    stat = os.stat(path)
+                except FileNotFoundError:
+                    continue
+                files.append((path, stat.st_size, stat.st_mtime))
+        return files
+
+    def __path(self, key: str) -> str:
+        return os.path.join(self.directory, key[:2], key)
+
+    def __set(self, path: str, size: int, used: float):
+        with self.__lock:
+            old_size, _ = self.__index.get(path, (0, 0))
+            self.__index[path] = (size, used)
+            self.__size += size - old_size
+
+    def get(self, key: str) -> bytes or None:
+        path = self.__path(key)
+        try:
+            if self.max_age is not None and time.time() - os.stat(path).st_mtime > self.max_age:
+                return None
+            with open(path, 'rb') as f:
+                data = f.read()
+            # modification time is used as last use time by other processes
+            os.utime(path)
+        except FileNotFoundError:
+            return None
+        # file can be written by other process, then it is added to index here
+        self.__set(path, len(data), time.time())
+        return data
+
+    def put(self, key: str, data: bytes):
+        path = self.__path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # write via temporary file, so other processes never read half written file
+        tmp_path = f'{path}.{os.getpid()}.{threading.get_ident()}.tmp'
+        with open(tmp_path, 'wb') as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+
+        self.__set(path, len(data), time.time())
+        if self.__size > self.max_bytes:
+            self.evict()
+
+    def evict(self):
+        """
+        This method remove old files and the least recently used files until size of the directory
+        is less then low_water part of max_bytes
+        """
+        with self.__lock:
+            limit = self.max_bytes * self.low_water
+            now = time.time()
+            for path, (size, used) in sorted(self.__index.items(), key=lambda item: item[1][1]):
+                if self.__size <= limit and (self.max_age is None or now - used <= self.max_age):
+                    break
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass
+                del self.__index[path]
+                self.__size -= size
+
+
+class _SqliteStore:
+    """
+    This class keep small values in one sqlite file, so millions of values don't become millions of files.
+    When size of values exceed max_bytes, the least recently used values are removed
+    until size is less than low_water part of max_bytes. File can be shared by several processes
+    """
+
+    def __init__(self, path: str, max_bytes: int, low_water: float = 0.8):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.low_water = low_water
+        self.__lock = threading.Lock()
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        # connection is used by several threads, calls are serialized by lock
+        self.__connection = sqlite3.connect(path, timeout=30, check_same_thread=False, isolation_level=None)
+        self.__connection.execute('PRAGMA journal_mode=WAL')
+        self.__connection.execute('PRAGMA synchronous=NORMAL')
+        self.__connection.execute(
+            'CREATE TABLE IF NOT EXISTS store (key TEXT PRIMARY KEY, value BLOB, size INTEGER, used REAL)')
+        self.__connection.execute('CREATE INDEX IF NOT EXISTS store_used ON store (used)')
+        self.__size = self.__connection.execute('SELECT COALESCE(SUM(size), 0) FROM store').fetchone()[0]
+
+    def get(self, key: str) -> bytes or None:
+        with self.__lock:
+            row = self.__connection.execute('SELECT value FROM store WHERE key = ?', (key,)).fetchone()
+            if row is None:
+                return None
+            self.__connection.execute('UPDATE store SET used = ? WHERE key = ?', (time.time(), key))
+        return row[0]
+
+    def put(self, key: str, data: bytes):
+        with self.__lock:
+            self.__connection.execute('INSERT OR REPLACE INTO store VALUES (?, ?, ?, ?)',
+                                      (key, data, len(data), time.time()))
+            self.__size += len(data)
+            if self.__size > self.max_bytes:
+                self.__evict()
+
+    def __evict(self):
+        # values of other processes are counted too
+        self.__size = self.__connection.execute('SELECT COALESCE(SUM(size), 0) FROM store').fetchone()[0]
+        excess = self.__size - self.max_bytes * self.low_water
+        if excess <= 0:
+            return
+        keys, freed = [], 0
+        for key, size in self.__connection.execute('SELECT key, size FROM store ORDER BY used'):
+            if freed >= excess:
+                break
+            keys.append((key,))
+            freed += size
+        self.__connection.execute('BEGIN')
+        self.__connection.executemany('DELETE FROM store WHERE key = ?', keys)
+        self.__connection.execute('COMMIT')
+        self.__size -= freed
+
+    def close(self):
+        with self.__lock:
+            self.__connection.close()
+
+
+class OcrCache:
+    """
+    This class keep recognized strings of cells, key of cell is hash of normalized image of cell
+    and parameters of recognition. Cache has two tiers: LRU in memory and optional sqlite file in directory on disk
+    """
+
+    def __init__(self, max_items: int = 10000, directory: str = None, max_disk_bytes: int = 256 * 2 ** 20):
+        self.max_items = max_items
+        self.directory = directory
+        self.max_disk_bytes = max_disk_bytes
+        self.hits = 0
+        self.misses = 0
+        self.__memory = OrderedDict()
+        self.__lock = threading.Lock()
+        self.__disk = (_SqliteStore(os.path.join(directory, 'ocr.sqlite'), max_disk_bytes)
+                       if directory is not None else None)
+
+    def __reduce__(self):
+        # memory tier isn't copied to other processes, disk tier is shared via directory
+        return self.__class__, (self.max_items, self.directory, self.max_disk_bytes)
+
+    @staticmethod
+    def __normalize(img: np.array) -> np.array:
+        """
+        This method binarize image of cell and cut off empty margins,
+        so the same content in cells with different size and brightness give the same image
+        """
+        if img.ndim == 3:
+            img = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
+        if img.size == 0:
+            return img
+        _, binary = cv2.threshold(img, 0, 255, cv2.THRESH_BINARY_INV + cv2.THRESH_OTSU)
+        x, y, w, h = cv2.boundingRect(binary)
+        return binary[y: y + h, x: x + w]
+
+    def key(self, img: np.array, model: str, allowlist: list = None, method: str = '') -> str:
+        """
+        This method return key of cell image for given model, admissible set character and read method
+        """
+        norm = np.ascontiguousarray(self.__normalize(img))
+        h = hashlib.blake2b(digest_size=20)
+        h.update(str(norm.shape).encode())
+        h.update(norm.tobytes())
+        h.update(f'{model}|{"".join(allowlist) if allowlist else ""}|{method}'.encode())
+        return h.hexdigest()
+
+    def get(self, key: str) -> str or None:
+        with self.__lock:
+            if key in self.__memory:
+                self.__memory.move_to_end(key)
+                self.hits += 1
+                return self.__memory[key]
+
+        if self.__disk is not None and (data := self.__disk.get(key)) is not None:
+            value = data.decode('utf-8')
+            self.__put_memory(key, value)
+            with self.__lock:
+                self.hits += 1
+            return value
+
+        with self.__lock:
+            self.misses += 1
+        return None
+
+    def __put_memory(self, key: str, value: str):
+        with self.__lock:
+            self.__memory[key] = value
+            self.__memory.move_to_end(key)
+            while len(self.__memory) > self.max_items:
+                self.__memory.popitem(last=False)
+
+    def put(self, key: str, value: str):
+        self.__put_memory(key, value)
+        if self.__disk is not None:
+            self.__disk.put(key, value.encode('utf-8'))
+
+    def stats(self) -> dict:
+        return {'hits': self.hits, 'misses': self.misses, 'items': len(self.__memory)}
+
+
+class DocumentCache:
+    """
+    This class keep tables of whole documents, key of document is digest of file content
+    and configuration of the pipeline. Tables are kept in memory and in directory on disk
+    """
+
+    def __init__(self, directory: str = None, max_bytes: int = 2 ** 30,
+                 max_age: float = 30 * 24 * 3600, max_items: int = 32):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+        self.max_items = max_items
+        self.hits = 0
+        self.misses = 0
+        self.__memory = OrderedDict()
+        self.__lock = threading.Lock()
+        self.__disk = _DiskStore(directory, max_bytes, max_age=max_age) if directory is not None else None
+
+    def __reduce__(self):
+        return self.__class__, (self.directory, self.max_bytes, self.max_age, self.max_items)
+
+    @staticmethod
+    def key(file: bytes or np.array, config: str = '') -> str:
+        """
+        This method return key of document, file is content of pdf file or decoded image
+        """
+        h = hashlib.sha256()
+        if isinstance(file, np.ndarray):
+            h.update(str(file.shape).encode())
+            h.update(np.ascontiguousarray(file).tobytes())
+        else:
+            h.update(file)
+        h.update(config.encode())
+        return h.hexdigest()
+
+    def get(self, key: str) -> pd.DataFrame or None:
+        with self.__lock:
+            entry = self.__memory.get(key)
+            if entry is not None and (self.max_age is None or time.time() - entry[1] <= self.max_age):
+                self.__memory.move_to_end(key)
+                self.hits += 1
+                # copy, so changes of returned table don't change cached table
+                return entry[0].copy()
+
+        if self.__disk is not None and (data := self.__disk.get(key)) is not None:
+            df = pickle.loads(data)
+            self.__put_memory(key, df)
+            with self.__lock:
+                self.hits += 1
+            return df.copy()
+
+        with self.__lock:
+            self.misses += 1
+        return None
+
+    def __put_memory(self, key: str, df: pd.DataFrame):
+        with self.__lock:
+            self.__memory[key] = (df, time.time())
+            self.__memory.move_to_end(key)
+            while len(self.__memory) > self.max_items:
+                self.__memory.popitem(last=False)
+
+    def put(self, key: str, df: pd.DataFrame):
+        df = df.copy()
+        self.__put_memory(key, df)
+        if self.__disk is not None:
+            self.__disk.put(key, pickle.dumps(df, protocol=pickle.HIGHEST_PROTOCOL))
+
+    def stats(self) -> dict:
+        return {'hits': self.hits, 'misses': self.misses, 'items': len(self.__memory)}
@@ -0,0 +1,146 @@
+import cv2
+import numpy as np
+
+
+class CellGrid:
+    """
+    This class keep cells of the table in one int32 array with shape (n_cols, n_rows, 4),
+    where last axis is (x, y, w, h) of the cell in coordinates of aligned image.
+    Cells are ordered like in list of columns: grid[i][j] is j-th cell from the top of i-th column
+    """
+
+    def __init__(self, cells: np.array):
+        cells = np.ascontiguousarray(cells, dtype=np.int32)
+        if cells.ndim != 3 or cells.shape[2] != 4:
+            raise ValueError(f'Cells array must have shape (n_cols, n_rows, 4), got {cells.shape}')
+        self.cells = cells
+
+    @classmethod
+    def from_columns(cls, columns_list: list) -> 'CellGrid':
+        """
+        This method make grid from list of columns with tuples (x, y, w, h), all columns must have equal length
+        """
+        if len({len(col) for col in columns_list}) > 1:
+            raise ValueError('All columns must have the same number of cells')
+        return cls(np.array(columns_list, dtype=np.int32).reshape(len(columns_list), -1, 4))
+
+    def to_columns(self) -> list:
+        return [list(map(tuple, col)) for col in self.cells.tolist()]
+
+    @property
+    def n_cols(self) -> int:
+        return self.cells.shape[0]
+
+    @property
+    def n_rows(self) -> int:
+        return self.cells.shape[1]
+
+    def __len__(self) -> int:
+        return self.n_cols
+
+    def __getitem__(self, col: int) -> np.array:
+        return self.cells[col]
+
+    def __iter__(self):
+        return iter(self.cells)
+
+    @property
+    def boxes(self) -> np.array:
+        """
+        (n_cols * n_rows, 4) view on cells, column after column
+        """
+        return self.cells.reshape(-1, 4)
+
+    @property
+    def cols(self) -> np.array:
+        """
+        column index of every box
+        """
+        return np.repeat(np.arange(self.n_cols, dtype=np.int32), self.n_rows)
+
+    @property
+    def rows(self) -> np.array:
+        """
+        row index of every box
+        """
+        return np.tile(np.arange(self.n_rows, dtype=np.int32), self.n_cols)
+
+    def spans(self) -> np.array:
+        """
+        This method return (n_cols, n_rows, 2) array with number of columns and rows which every cell cover,
+        columns and rows of the table start on median x and y of their cells
+        """
+        x, y, w, h = np.moveaxis(self.cells, -1, 0)
+        col_starts = np.sort(np.median(x, axis=1))
+        row_starts = np.sort(np.median(y, axis=0))
+        col_span = np.searchsorted(col_starts, x + w, side='left') - np.searchsorted(col_starts, x, side='left')
+        row_span = np.searchsorted(row_starts, y + h, side='left') - np.searchsorted(row_starts, y, side='left')
+        return np.maximum(np.stack([col_span, row_span], axis=-1), 1)
+
+    def areas(self) -> np.array:
+        return self.cells[..., 2].astype(np.int64) * self.cells[..., 3]
+
+    def crop(self, image: np.array, col: int, row: int) -> np.array:
+        """
+        This method return view on cell in image without copy
+        """
+        x, y, w, h = self.cells[col, row]
+        return image[max(y, 0): y + h, max(x, 0): x + w]
+
+    def crops(self, image: np.array):
+        """
+        This generator yield column index, row index and view on cell in image
+        """
+        for col in range(self.n_cols):
+            for row in range(self.n_rows):
+                yield col, row, self.crop(image, col, row)
+
+    def ink(self, binary: np.array) -> np.array:
+        """
+        This method return (n_cols, n_rows) array with part of nonzero pixels of binary image in every cell
+        """
+        integral = cv2.integral((binary > 0).astype(np.uint8))
+        height, width = binary.shape[:2]
+        x, y, w, h = np.moveaxis(self.cells.astype(np.int64), -1, 0)
+        x0, y0 = np.clip(x, 0, width), np.clip(y, 0, height)
+        x1, y1 = np.clip(x + w, 0, width), np.clip(y + h, 0, height)
+        count = integral[y1, x1] - integral[y0, x1] - integral[y1, x0] + integral[y0, x0]
+        return count / np.maximum(self.areas(), 1)
+
+    def scaled(self, scale: float) -> 'CellGrid':
+        """
+        This method return grid in coordinates of image resized by scale
+        """
+        x, y, w, h = np.moveaxis(self.cells.astype(np.float64), -1, 0)
+        x0, y0 = np.round(x * scale), np.round(y * scale)
+        x1, y1 = np.round((x + w) * scale), np.round((y + h) * scale)
+        return CellGrid(np.stack([x0, y0, x1 - x0, y1 - y0], axis=-1))
+
+    def iou(self, other: 'CellGrid') -> np.array:
+        """
+        This method return (n_cols, n_rows) array with intersection over union of cells of two grids
+        with the same shape
+        """
+        if self.cells.shape != other.cells.shape:
+            raise ValueError(f'Grids have different shapes: {self.cells.shape} and {other.cells.shape}')
+        a, b = self.cells.astype(np.int64), other.cells.astype(np.int64)
+        left = np.maximum(a[..., 0], b[..., 0])
+        top = np.maximum(a[..., 1], b[..., 1])
+        right = np.minimum(a[..., 0] + a[..., 2], b[..., 0] + b[..., 2])
+        bottom = np.minimum(a[..., 1] + a[..., 3], b[..., 1] + b[..., 3])
+        inter = np.clip(right - left, 0, None) * np.clip(bottom - top, 0, None)
+        union = self.areas() + other.areas() - inter
+        return inter / np.maximum(union, 1)
+
+    def to_bytes(self) -> bytes:
+        shape = np.array(self.cells.shape, dtype=np.int32)
+        return shape.tobytes() + self.cells.tobytes()
+
+    @classmethod
+    def from_bytes(cls, data: bytes) -> 'CellGrid':
+        shape = np.frombuffer(data, dtype=np.int32, count=3)
+        # array on bytes is read only, copy, so cells of the grid can be changed like cells of other grids
+        return cls(np.frombuffer(data, dtype=np.int32, offset=shape.nbytes).reshape(shape).copy())
+
+    def __repr__(self) -> str:
+        return f'CellGrid(n_cols={self.n_cols}, n_rows={self.n_rows})'
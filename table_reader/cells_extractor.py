@@ -1,74 +1,59 @@
 import cv2
 import numpy as np
-from scipy.stats import mode
 
+from table_reader.cell_grid import CellGrid
 from table_reader.cells_extractor_interface import CellsExtractorInterface
+from table_reader.image_processing import PreparedPage, binarize, prepare_page
+from table_reader.tracing import tracer
+
+
+def cluster_1d(values: np.array, epsilon: float) -> np.array:
+    """
+    This function split values on clusters, neighbour values after sorting are in one cluster
+    if gap between them isn't greater than epsilon.
+    Return label of cluster for every value, labels grow together with values
+    """
+    values = np.asarray(values)
+    order = np.argsort(values, kind='stable')
+    gaps = np.diff(values[order]) > epsilon
+    labels = np.empty(len(values), dtype=np.int64)
+    labels[order] = np.concatenate([[0], np.cumsum(gaps)])
+    return labels
 
 
 class CellsExtractor(CellsExtractorInterface):
-    def __init__(self, threshold_func: callable = None):
+    def __init__(self, threshold_func: callable = None, column_tolerance: int = 20, target_width: int = None,
+                 grid_engine: str = 'hough', cells_engine: str = 'contours'):
+        """
+        column_tolerance -- max gap between x of neighbour cells of one column
+        target_width -- if given, then grid is found on copy of the page downscaled to this width,
+        cells are mapped back to coordinates of full resolution page for reading
+        grid_engine -- 'hough' find cells as contours of grid strengthened via Hough lines,
+        'projection' find rulings via row and column sums and build cells between them
+        cells_engine -- how 'hough' engine get cells from grid: 'contours' walk tree of contours,
+        'components' label insides of cells via connected components, its grid isn't always the same
+        (on table_fenomika it find 11x10 cells instead of 10x9: it find column 'Растение',
+        but lose row 'Стандартное отклонение'), so 'contours' is the default
+        """
+        if grid_engine not in ('hough', 'projection'):
+            raise ValueError(f'Unknown grid engine ({grid_engine}). \nAvailable engines: hough, projection')
+        if cells_engine not in ('contours', 'components'):
+            raise ValueError(f'Unknown cells engine ({cells_engine}). \nAvailable engines: contours, components')
+        self.grid_engine = grid_engine
+        self.cells_engine = cells_engine
+
         if threshold_func is None:
-            self.threshold_func = lambda img: cv2.adaptiveThreshold(img, 255,
-                                                                    cv2.ADAPTIVE_THRESH_GAUSSIAN_C,
-                                                                    cv2.THRESH_BINARY_INV, 11, 2)
+            self.threshold_func = binarize
         else:
             self.threshold_func = threshold_func
+        self.column_tolerance = column_tolerance
+        self.target_width = target_width
 
-    def __align_image(self, img: np.array) -> np.array:
+    def prepare_page(self, img: np.array) -> PreparedPage:
         """
-        This method align image find corner table and performs affine transform
+        This method align image and threshold it via threshold function of this extractor
         """
-        gray = cv2.cvtColor(img.copy(), cv2.COLOR_BGR2GRAY)
-        binary_img = cv2.adaptiveThreshold(gray, 255,
-                                           cv2.ADAPTIVE_THRESH_GAUSSIAN_C,
-                                           cv2.THRESH_BINARY_INV, 11, 2)
-
-        contours, _ = cv2.findContours(binary_img,
-                                       method=cv2.CHAIN_APPROX_SIMPLE,
-                                       mode=cv2.RETR_EXTERNAL)
-        # find contour of the table
-        max_size = -1
-        max_bbox = None
-        for cnt in contours:
-            x, y, w, h = cv2.boundingRect(cnt)
-            if w > 30 and h > 20:
-                if w * h > max_size:
-                    max_bbox = cnt
-                    max_size = w * h
-
-        rect = cv2.minAreaRect(max_bbox)
-        box = cv2.boxPoints(rect)
-
-        # getting coordinates corners of the table
-        pts1 = np.float32(box)
-        pts1 = sorted(pts1.tolist(), key=lambda x: x[0])
-
-        '''
-        after sorted pts1 contein coordinates corners table,
-        first two -- coordinates two left corners
-        second two -- coordinates two right corners
-        '''
-
-        left_top = min(pts1[0:2], key=lambda x: x[1])
-        left_bottom = max(pts1[0:2], key=lambda x: x[1])
-        right_top = min(pts1[2:4], key=lambda x: x[1])
-        right_bottom = max(pts1[2:4], key=lambda x: x[1])
-
-        pts1 = np.array([left_top, right_top,
-                         left_bottom, right_bottom], np.float32)
-
-        _, _, height, width = cv2.boundingRect(max_bbox)
-
-        pts2 = np.float32([[0, 0], [height, 0],
-                           [0, width], [height, width]])
-
-        # align image
-        M = cv2.getPerspectiveTransform(pts1, pts2)
-        dst = cv2.warpPerspective(img, M, (height, width))
-
-        cv2.rectangle(dst, (2, 2), (height - 2, width - 2), color=(0, 0, 0), thickness=2)
-
-        return dst
+        return prepare_page(img, threshold_func=self.threshold_func)
 
     def __morph(self, img_bin: np.array,
                 kernel: np.array,
@@ -78,29 +63,28 @@ class CellsExtractor(CellsExtractorInterface):
         img_lines = cv2.dilate(img_temp, kernel, iterations=iterations)
         return img_lines
 
-    def __over_draw_boxes(self, img_bin: np.array) -> np.array:
+    def __over_draw_boxes(self, img_bin: np.array, scale: float = 1.0) -> np.array:
         """
         strengthening the borders of table cells
         """
         lines = cv2.HoughLinesP(image=img_bin, rho=1,
                                 theta=np.pi / 180,
-                                threshold=100,
+                                threshold=max(1, round(100 * scale)),
                                 lines=np.array([]),
-                                minLineLength=100,
-                                maxLineGap=50)
+                                minLineLength=round(100 * scale),
+                                maxLineGap=round(50 * scale))
 
         for i in range(lines.shape[0]):
             cv2.line(img_bin,
                      (lines[i][0][0], lines[i][0][1]),
                      (lines[i][0][2], lines[i][0][3]),
                      (255, 255, 255),
-                     2, cv2.LINE_AA)
+                     max(1, round(2 * scale)), cv2.LINE_AA)
         return img_bin
 
-    def __get_boxes(self, bin_im: np.array, it: int = 1) -> np.array:
+    def __get_lines(self, bin_im: np.array, it: int = 1) -> tuple:
         """
-        This method find vertical and horizontal line binary on image table,
-        after strengthening the borders of table via morphological open
+        This method find vertical and horizontal line binary on image table via morphological open
         """
         kernel_length = np.array(bin_im).shape[1] // 100
 
@@ -112,14 +96,77 @@ class CellsExtractor(CellsExtractorInterface):
         # find horizontal lines on image
         bin_im_h = self.__morph(bin_im, kernel=horizontal_kernel, iterations=it)
 
-        v = self.__over_draw_boxes(bin_im_v)
-        h = self.__over_draw_boxes(bin_im_h)
+        return bin_im_v, bin_im_h
+
+    def __get_boxes(self, bin_im: np.array, it: int = 1, scale: float = 1.0) -> np.array:
+        """
+        This method find vertical and horizontal line binary on image table,
+        after strengthening the borders of table via morphological open
+        """
+        with tracer.span('morphology'):
+            bin_im_v, bin_im_h = self.__get_lines(bin_im, it=it)
+
+        with tracer.span('hough'):
+            v = self.__over_draw_boxes(bin_im_v, scale=scale)
+            h = self.__over_draw_boxes(bin_im_h, scale=scale)
 
-        # get table grid
-        boxes = cv2.add(v, h)
+            # get table grid
+            boxes = cv2.add(v, h)
 
         return boxes
 
+    @staticmethod
+    def __find_rulings(lines_im: np.array, axis: int, min_gap: float, min_fill: float = 0.3) -> np.array:
+        """
+        This method find rulings via projection profile of lines image in one pass,
+        axis=0 -- vertical rulings (sums of columns), axis=1 -- horizontal rulings (sums of rows).
+        Return (n, 2) array with first and last pixel of every ruling,
+        rulings closer then min_gap are merged (double lines, thick lines)
+        """
+        profile = np.count_nonzero(lines_im, axis=axis)
+        is_line = np.concatenate([[False], profile >= min_fill * lines_im.shape[axis], [False]])
+
+        # runs of pixels which belong to line
+        edges = np.flatnonzero(np.diff(is_line.astype(np.int8)))
+        starts, ends = edges[0::2], edges[1::2] - 1
+        if len(starts) == 0:
+            return np.empty((0, 2), dtype=np.int64)
+
+        # merge runs with small gap between them
+        new_ruling = np.concatenate([[True], starts[1:] - ends[:-1] > min_gap])
+        first = np.flatnonzero(new_ruling)
+        last = np.concatenate([first[1:], [len(starts)]]) - 1
+        return np.stack([starts[first], ends[last]], axis=1)
+
+    def __projection_cells(self, bin_im: np.array, scale: float = 1.0, min_size: int = 15) -> CellGrid:
+        """
+        This method build lattice of cells between vertical and horizontal rulings,
+        cells have the same bounds as contours of holes in table grid
+        """
+        with tracer.span('morphology'):
+            bin_im_v, bin_im_h = self.__get_lines(bin_im, it=5)
+        min_gap = min_size * scale
+
+        with tracer.span('rulings'):
+            v_rulings = self.__find_rulings(bin_im_v, axis=0, min_gap=min_gap)
+            h_rulings = self.__find_rulings(bin_im_h, axis=1, min_gap=min_gap)
+        if len(v_rulings) < 2 or len(h_rulings) < 2:
+            raise ValueError('Table grid not found')
+
+        # cell start on last pixel of previous ruling and end on first pixel of next ruling
+        x = v_rulings[:-1, 1]
+        w = v_rulings[1:, 0] - x + 1
+        y = h_rulings[:-1, 1]
+        h = h_rulings[1:, 0] - y + 1
+
+        n_cols, n_rows = len(x), len(y)
+        cells = np.empty((n_cols, n_rows, 4), dtype=np.int64)
+        cells[..., 0] = x[:, None]
+        cells[..., 1] = y[None, :]
+        cells[..., 2] = w[:, None]
+        cells[..., 3] = h[None, :]
+        return CellGrid(cells)
+
     def __get_cells(self, contours: list,
                     min_w: int = 15,
                     min_h: int = 15) -> tuple:
@@ -137,46 +184,52 @@ class CellsExtractor(CellsExtractorInterface):
                 cntr.append(cnt)
         return cells_list, cntr
 
+    def __get_component_cells(self, grid: np.array,
+                              min_w: int = 15,
+                              min_h: int = 15) -> np.array:
+        """
+        This method find cells as connected components of inverted grid,
+        all filtering is done on array of components statistics
+        """
+        # lines are drawn with antialiasing, so every nonzero pixel belong to lines
+        inverted = cv2.compare(grid, 0, cv2.CMP_EQ)
+        # insides of cells are 4-connected, like holes of contours
+        _, _, stats, _ = cv2.connectedComponentsWithStats(inverted, connectivity=4)
+        # 0 component is lines of grid
+        x, y, w, h = stats[1:, :4].T
+
+        height, width = grid.shape[:2]
+        # components which touch border of image lie outside of the table
+        inside = (x > 0) & (y > 0) & (x + w < width) & (y + h < height)
+        # bounds of contour of hole lie on lines around it, so box is wider by one pixel on every side
+        keep = inside & (w + 2 > min_w) & (h + 2 > min_h)
+        return np.stack([x[keep] - 1, y[keep] - 1, w[keep] + 2, h[keep] + 2], axis=1)
+
     def __get_columns(self, cells_list: list,
                       epsilon: int = 20) -> list:
         """
-        This method find all cells which are on the same line with +- error
+        This method find all cells which are on the same line with +- error,
+        return list of columns, column is array of cells sorted from top to bottom
         """
+        cells = np.array(cells_list, dtype=np.int64).reshape(-1, 4)
+        if len(cells) == 0:
+            return []
 
-        cells_list.sort(key=lambda x: (x[0], x[1]))
-
-        columns_list = []
-
-        val = -1
-        index = 0
+        labels = cluster_1d(cells[:, 0], epsilon)
 
-        for cell in cells_list:
-            x = cell[0]
-            if val == -1:
-                val = x
-                columns_list.append([])
-                columns_list[index].append(cell)
-                continue
-            if val - epsilon <= x <= val + epsilon:
-                columns_list[index].append(cell)
-            elif val < x:
-                val = x
-                columns_list.append([])
-                index += 1
-                columns_list[index].append(cell)
+        # sort by column, then by y
+        order = np.lexsort((cells[:, 0], cells[:, 1], labels))
+        cells, labels = cells[order], labels[order]
 
-        res_list = []
-        for col in columns_list:
-            res_list.append(sorted(col, key=lambda x: x[1]))
-
-        return res_list
+        return np.split(cells, np.flatnonzero(np.diff(labels)) + 1)
 
     def __get_list_uniform_columns(self, list_col: list) -> list:
         """
         This method remove columns with a very small or a very small amount cells
         """
         lengths_col = [len(col) for col in list_col]
-        m = mode(lengths_col)[0]
+        # the most common length, the smallest of them if there are several
+        m = np.bincount(lengths_col).argmax()
 
         new_col_list = []
         for col in list_col:
@@ -184,94 +237,152 @@ class CellsExtractor(CellsExtractorInterface):
                 new_col_list.append(col)
         return new_col_list
 
-    def __complete_table(self, columns_list: list) -> list:
+    def __complete_table(self, columns_list: list) -> CellGrid:
         """
         This method refind cells if on last steps been find not all cells
         (note: in columns list cells was sorted, 0 cell in column it upper recognized cell on image)
         """
-        new_columns_list = [[] for i in range(len(columns_list))]
-        cache = [[] for i in range(len(columns_list))]
-
-        # add to the end tuple with -1 so that the lengths columns are equal (need for numpy)
-        def supplement(l, m):
-            for i, c in enumerate(l):
-                if (k := len(c)) < m:
-                    l[i] = l[i] + [(-1, -1, -1, -1)] * (m - k)
-            return l
-
+        n_cols = len(columns_list)
         max_len_col = len(max(columns_list, key=len))
-        columns_list = supplement(columns_list, max_len_col)
 
-        # for columns slice
-        columns_list = np.array(columns_list)
+        # (n_cols, n_rows, 4) array, where missing cells in the end of short columns are (-1, -1, -1, -1)
+        cells = np.full((n_cols, max_len_col, 4), -1, dtype=np.int64)
+        for index, col in enumerate(columns_list):
+            cells[index, :len(col)] = col
+        x, y, w, h = np.moveaxis(cells, -1, 0)
+        present = x != -1
+
+        # upper cell on every level, if several cells on the same height, then cell from the left column
+        upper = np.argmin(np.where(present, y, np.iinfo(np.int64).max), axis=0)
+        levels = np.arange(max_len_col)
+        up_y = y[upper, levels]
+        up_h = h[upper, levels]
+        eps = up_h // 2
+
+        columns = np.arange(n_cols)
+        new_cells = np.empty_like(cells)
+        # cached[i, j] -- cell j of column i was replaced on its level and wait for a level which it fit
+        cached = np.zeros((n_cols, max_len_col), dtype=bool)
 
         for idx in range(max_len_col):
-            slice_ = columns_list[:, idx]
-            # find upper cell on idx level
-            _, up_y, _, h = min(
-                list(filter(lambda x: x[0] != -1, slice_)),
-                key=lambda x: x[1])  # upper cell
-            eps = h // 2
-
-            # i th element of slice match i th column
-            for index, cell in enumerate(slice_):
-                cell = tuple(cell)
-                x, y, w, _ = cell
-                # if current cell locate on one line with upper cell on image, add her in new list
-                if up_y <= y <= up_y + eps:
-                    new_columns_list[index].append(cell)
-                # if current cell locate on other line on image
-                else:
-                    # extract fit cell
-                    cache_val = list(filter(lambda x: up_y <= x[1] <= up_y + eps, cache[index]))
-                    # if in cache no fit cells
-                    if len(cache_val) == 0:
-                        # if current cell not (-1, -1, -1, -1) tuple,
-                        # then get x, w from current cell and y, h from upper cell
-                        # and make new cell from these properties cells
-                        # current cell add to cache
-                        if x != -1:
-                            new_columns_list[index].append((x, up_y, w, h))
-                            cache[index].append(cell)
-                        # if current cell (-1, -1, -1, -1) tuple,
-                        #  get x, w from 0 cell in [index] columns and y, h from upper cell
-                        else:
-                            x, _, w, _ = columns_list[index][0]  # get some cell
-                            new_columns_list[index].append((x, up_y, w, h))
-                    else:
-                        # if fit cell was in cache, extract her
-                        cache_val = tuple(cache_val[0])
-                        new_columns_list[index].append(cache_val)
-                        cache[index].remove(cache_val)
-
-        return new_columns_list
-
-    def get_table_grid(self, image: np.array) -> tuple:
+            top, bottom = up_y[idx], up_y[idx] + eps[idx]
+            # cells located on one line with upper cell stay on their places
+            level = cells[:, idx].copy()
+            other_line = ~((top <= y[:, idx]) & (y[:, idx] <= bottom))
+
+            # cached cells which fit current level, the earliest cached cell is taken
+            # (cells of current level aren't cached yet, so slice includes it only to be never empty)
+            fit = cached[:, :idx + 1] & (top <= y[:, :idx + 1]) & (y[:, :idx + 1] <= bottom)
+            has_fit = fit.any(axis=1)
+            first_fit = fit.argmax(axis=1)
+
+            from_cache = other_line & has_fit
+            level[from_cache] = cells[columns[from_cache], first_fit[from_cache]]
+            cached[columns[from_cache], first_fit[from_cache]] = False
+
+            # if in cache no fit cells, then get x, w from current cell and y, h from upper cell,
+            # current cell goes to cache; for missing cell x, w are got from 0 cell of the column
+            new_cell = other_line & ~has_fit
+            level[new_cell, 0] = np.where(present[:, idx], x[:, idx], x[:, 0])[new_cell]
+            level[new_cell, 1] = top
+            level[new_cell, 2] = np.where(present[:, idx], w[:, idx], w[:, 0])[new_cell]
+            level[new_cell, 3] = up_h[idx]
+            cached[new_cell & present[:, idx], idx] = True
+
+            new_cells[:, idx] = level
+
+        return CellGrid(new_cells)
+
+    def __find_grid(self, bin_im: np.array, scale: float = 1.0) -> tuple:
         """
-        This method find table grid via morphology open
+        This method find table grid via morphology open,
+        scale is ratio of size of binary image to size of the page
         """
-        align_im = self.__align_image(image.copy())
-
-        img_grey = cv2.cvtColor(align_im, cv2.COLOR_BGR2GRAY)
-        bin_im = self.threshold_func(img_grey)
-
         # table grid
-        grid = self.__get_boxes(bin_im, it=5)
+        grid = self.__get_boxes(bin_im, it=5, scale=scale)
 
-        contours, _ = cv2.findContours(grid, cv2.RETR_TREE, cv2.CHAIN_APPROX_SIMPLE)
+        with tracer.span('contours'):
+            contours, _ = cv2.findContours(grid, cv2.RETR_TREE, cv2.CHAIN_APPROX_SIMPLE)
 
         return grid, contours
 
-    def extract_cells(self, img: np.array) -> list:
-        _, contours = self.get_table_grid(img)
-
-        bbox_list, _ = self.__get_cells(contours)
+    def get_table_grid(self, page: PreparedPage or np.array) -> tuple:
+        """
+        This method find table grid via morphology open
+        """
+        if not isinstance(page, PreparedPage):
+            page = self.prepare_page(page)
 
-        columns_list = self.__get_columns(bbox_list)  # list of list with tuples (x, y, w, h) -- cells properties
-        columns_list[0] = columns_list[0][1::]  # remove image of the table from list with cells
+        return self.__find_grid(page.binary)
 
-        # remove columns with small or large number cells
-        columns_list = self.__get_list_uniform_columns(columns_list)
+    def __hough_cells(self, bin_im: np.array, scale: float = 1.0) -> CellGrid:
+        if self.cells_engine == 'components':
+            grid = self.__get_boxes(bin_im, it=5, scale=scale)
+            with tracer.span('contours'):
+                bbox_list = self.__get_component_cells(grid, min_w=15 * scale, min_h=15 * scale)
+        else:
+            _, contours = self.__find_grid(bin_im, scale=scale)
+
+            with tracer.span('contours'):
+                bbox_list, _ = self.__get_cells(contours, min_w=15 * scale, min_h=15 * scale)
+
+        with tracer.span('clustering'):
+            # list of arrays with rows (x, y, w, h) -- cells properties
+            columns_list = self.__get_columns(bbox_list, epsilon=self.column_tolerance * scale)
+            if self.cells_engine == 'contours':
+                columns_list[0] = columns_list[0][1::]  # remove image of the table from list with cells
+
+            # remove columns with small or large number cells
+            columns_list = self.__get_list_uniform_columns(columns_list)
+
+        with tracer.span('completion'):
+            return self.__complete_table(columns_list)
+
+    def __extract_cells(self, page: PreparedPage, target_width: int = None) -> CellGrid:
+        scale = 1.0
+        if target_width is not None and page.gray.shape[1] > target_width:
+            # find grid on downscaled page, all sizes in pixels are scaled too
+            scale = target_width / page.gray.shape[1]
+            small = cv2.resize(page.gray, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA)
+            with tracer.span('threshold'):
+                bin_im = self.threshold_func(small)
+        else:
+            bin_im = page.binary
 
-        columns_list = self.__complete_table(columns_list)
-        return columns_list
+        if self.grid_engine == 'projection':
+            grid = self.__projection_cells(bin_im, scale=scale)
+        else:
+            grid = self.__hough_cells(bin_im, scale=scale)
+
+        if scale != 1.0:
+            # cells are read on full resolution page
+            grid = grid.scaled(1 / scale)
+        return grid
+
+    def extract_cells(self, page: PreparedPage or np.array) -> CellGrid:
+        if not isinstance(page, PreparedPage):
+            page = self.prepare_page(page)
+        with tracer.span('extract_cells') as span:
+            grid = self.__extract_cells(page, target_width=self.target_width)
+            span.count(cells=grid.n_cols * grid.n_rows)
+        return grid
+
+    def check_resolution(self, page: PreparedPage or np.array) -> dict:
+        """
+        This method compare cells found on downscaled page with cells found on full resolution page,
+        return shapes of both grids and intersection over union of their cells
+        """
+        if not isinstance(page, PreparedPage):
+            page = self.prepare_page(page)
+        full = self.__extract_cells(page)
+        small = self.__extract_cells(page, target_width=self.target_width)
+
+        report = {'full_shape': (full.n_cols, full.n_rows),
+                  'downscaled_shape': (small.n_cols, small.n_rows),
+                  'mean_iou': None,
+                  'share_iou_090': None}
+        if report['full_shape'] == report['downscaled_shape']:
+            iou = full.iou(small)
+            report['mean_iou'] = float(iou.mean())
+            report['share_iou_090'] = float((iou >= 0.9).mean())
+        return report
@@ -1,7 +1,16 @@
 from abc import ABC, abstractmethod
 
+from table_reader.cell_grid import CellGrid
+from table_reader.image_processing import PreparedPage, prepare_page
+
 
 class CellsExtractorInterface(ABC):
     @abstractmethod
-    def extract_cells(self, img: list) -> list:
+    def extract_cells(self, img: PreparedPage or list) -> CellGrid:
         pass
+
+    def prepare_page(self, img: list) -> PreparedPage:
+        """
+        This method align image once, result shared by extract_cells and read_cells
+        """
+        return prepare_page(img)
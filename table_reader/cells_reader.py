@@ -1,17 +1,70 @@
 from table_reader.cells_reader_interface import CellsReaderInterface
-import easyocr
+from table_reader.batching import CropBatcher, read_in_groups
+from table_reader.cache import OcrCache
+from table_reader.cell_grid import CellGrid
+from table_reader.image_processing import PreparedPage
+from table_reader.model_registry import registry
+from table_reader.tracing import tracer
+import cv2
+import numpy as np
 import re
 
 
+def _match_detections(grid: CellGrid, points: np.array, shift: int = 5) -> list:
+    """
+    This function find for every cell indexes of detections which top left corner lies in the cell (+- shift).
+    Detections are sorted by x once, for every column are taken only detections in x band of the column
+    and cells of the column find own detections via binary search by y,
+    so work grow linearly with number of cells and detections.
+    Return list of columns, where every column is list of sorted arrays of indexes
+    """
+    order_x = np.argsort(points[:, 0], kind='stable')
+    sorted_x = points[order_x, 0]
+
+    matched = []
+    for col in grid:
+        cells = col.astype(float)
+        if len(cells) == 0:
+            matched.append([])
+            continue
+        x, y, w, h = cells.T
+        left, right = x - shift, x + w + shift
+        top, bottom = y - shift - 5, y + h + shift
+
+        # detections in x band of the column
+        start = np.searchsorted(sorted_x, left.min(), side='left')
+        end = np.searchsorted(sorted_x, right.max(), side='right')
+        candidates = order_x[start:end]
+
+        # sort candidates by y for binary search
+        candidates = candidates[np.argsort(points[candidates, 1], kind='stable')]
+        candidates_y = points[candidates, 1]
+        first = np.searchsorted(candidates_y, top, side='left')
+        last = np.searchsorted(candidates_y, bottom, side='right')
+
+        col_matched = []
+        for i in range(len(cells)):
+            idx = candidates[first[i]:last[i]]
+            idx_x = points[idx, 0]
+            idx = idx[(left[i] <= idx_x) & (idx_x <= right[i])]
+            col_matched.append(np.sort(idx))
+        matched.append(col_matched)
+    return matched
+
+
 class CellsReader(CellsReaderInterface):
     # proxy class
     class __Model:
         # This class is necessary because models have different methods name for read text from image
         # This class solving this problem
-        def __init__(self, model: object, model_name: str, lang: str = 'rus'):
+        def __init__(self, model_name: str, lang: list):
             self.lang = lang
             self.name = model_name
-            self.model = model
+
+        @property
+        def model(self) -> object:
+            # model is loaded on first use and then stay loaded in registry
+            return registry.get(self.name, self.lang)
 
         def simple_read(self, img):
             """
@@ -36,6 +89,65 @@ class CellsReader(CellsReaderInterface):
                                           min_size=min_size, height_ths=height_ths, width_ths=width_ths)
             return res
 
+        def detect(self, img, min_size=10, height_ths=0.5, width_ths=0.5):
+            """
+            This method find text boxes on image, return horizontal boxes and free boxes
+            """
+            horizontal_list, free_list = self.model.detect(img, min_size=min_size,
+                                                           height_ths=height_ths, width_ths=width_ths)
+            # detector return boxes for list of images
+            return horizontal_list[0], free_list[0]
+
+        def recognize(self, gray, horizontal_list, free_list, allowlist=None, detail=0):
+            """
+            This method read text in boxes found by detect
+            """
+            return self.model.recognize(gray, horizontal_list=horizontal_list, free_list=free_list,
+                                        allowlist=allowlist, detail=detail, reformat=False)
+
+        def read_crops(self, crops, allowlist=None, batch_size=16, model_height=64):
+            """
+            This method read list of gray crops, crops are resized to height of recognizer
+            and sent to recognizer in batches of batch_size crops, return strings in order of crops.
+            Reader.recognize read boxes one by one on cpu, so recognizer of easyocr is called directly
+            (get_text), then crops are really read in batches on cpu too. All crops of one call are padded
+            to the widest crop, so crops with similar ratio of width to height should be read together
+            """
+            if self.name != 'easyocr':
+                return [self.simple_read(crop) for crop in crops]
+
+            from easyocr.recognition import get_text
+            from easyocr.utils import compute_ratio_and_resize
+
+            # empty crops and crops which become empty after resize can't be read
+            image_list = []
+            max_ratio = 1
+            for i, crop in enumerate(crops):
+                h, w = crop.shape[:2]
+                if h == 0 or w == 0 or int(model_height * max(w / h, h / w)) == 0:
+                    continue
+                resized, ratio = compute_ratio_and_resize(crop, w, h, model_height)
+                # index of crop is passed instead of box, recognizer return it with string
+                image_list.append((i, resized))
+                max_ratio = max(max_ratio, ratio)
+
+            strings = [''] * len(crops)
+            if len(image_list) == 0:
+                return strings
+
+            model = self.model
+            if allowlist:
+                ignore_char = ''.join(set(model.character) - set(allowlist))
+            else:
+                ignore_char = ''.join(set(model.character) - set(model.lang_char))
+            result = get_text(model.character, model_height, int(np.ceil(max_ratio) * model_height),
+                              model.recognizer, model.converter, image_list, ignore_char=ignore_char,
+                              decoder='greedy', beamWidth=5, batch_size=batch_size, contrast_ths=0.1,
+                              adjust_contrast=0.5, filter_ths=0.003, workers=0, device=model.device)
+            for i, text, _ in result:
+                strings[i] = text
+            return strings
+
     def __get_models(self, models: str, lang: list):
         """
         This method return list of models, where all models have the same name methods for read text
@@ -45,8 +157,7 @@ class CellsReader(CellsReaderInterface):
         for name in models_name_list[0:2]:
             if name == 'easyocr':
                 models_list.append(
-                    self.__Model(model=easyocr.Reader(lang),
-                                 model_name='easyocr')
+                    self.__Model(model_name='easyocr', lang=lang)
                 )
             elif name == 'tesseract':
                 pass
@@ -56,7 +167,22 @@ class CellsReader(CellsReaderInterface):
                 raise ValueError(f'Unknown model ({name}). \nAvailable models: easyocr, tesseract, trocr-base-stage1')
         return models_list
 
-    def __init__(self, model: str = 'easyocr', lang: list = ['ru']):
+    def __init__(self, model: str = 'easyocr', lang: list = ['ru'], batched: bool = True, batch_size: int = 16,
+                 cache: OcrCache = None, batcher: CropBatcher = None):
+        """
+        batched -- if True, then simple method send all cells of the page to recognizer at once
+        and skip text detection, cells geometry is used as text boxes
+        cache -- if given, then cells with already seen content aren't recognized again
+        batcher -- if given, then batched cells are read in batches shared with other threads
+        batch_size -- number of cells in one call of recognizer, on cpu batches of 4-16 cells are the fastest,
+        on gpu larger batches are better
+        """
+        self.model_name = model
+        self.lang = lang
+        self.batched = batched
+        self.batch_size = batch_size
+        self.cache = cache
+        self.batcher = batcher
         self.models = self.__get_models(models=model, lang=lang)
 
         self.allow_list_all = []
@@ -73,35 +199,161 @@ class CellsReader(CellsReaderInterface):
             self.allow_list_num.append(str(i))
         self.allow_list_all += self.allow_list_num
 
-    def read_cells(self, columns_list: list, img: list, method: str = 'simple') -> list:
-        if method == 'simple':
-            table = self.simple_read(columns_list, img)
-        elif method == 'scan':
-            table = self.scan_read(columns_list, img)
+    def warm_up(self):
+        """
+        This method load models of the reader, otherwise they are loaded on the first read
+        """
+        for model in self.models:
+            _ = model.model
+
+    def __reduce__(self):
+        # models weights are not pickled, models are loaded again in the process which unpickle reader
+        return self.__class__, (self.model_name, self.lang, self.batched, self.batch_size, self.cache)
+
+    def __cache_key(self, im: list, model: __Model, method: str, allowlist: list = None) -> str:
+        return self.cache.key(im, f'{model.name}:{"+".join(model.lang)}', allowlist=allowlist, method=method)
+
+    def __cached_read(self, im: list, model: __Model, method: str, read: callable, allowlist: list = None) -> str:
+        """
+        This method return string from cache, if there is no string for this image, then call read
+        """
+        if self.cache is None:
+            tracer.count(cells_ocr=1)
+            return read()
+        key = self.__cache_key(im, model, method, allowlist=allowlist)
+        if (s := self.cache.get(key)) is None:
+            tracer.count(cells_ocr=1)
+            s = read()
+            self.cache.put(key, s)
         else:
+            tracer.count(cache_hits=1)
+        return s
+
+    def read_cells(self, grid: CellGrid, img: PreparedPage or list, method: str = 'simple') -> list:
+        if not isinstance(grid, CellGrid):
+            grid = CellGrid.from_columns(grid)
+
+        # cells coordinates are given in coordinates of aligned image
+        gray = None
+        if isinstance(img, PreparedPage):
+            gray = img.gray
+            img = img.image
+
+        if method not in ('simple', 'scan'):
             raise ValueError(f'Not support method {method}')
+
+        with tracer.span('read_cells', cells=grid.n_cols * grid.n_rows):
+            if method == 'simple':
+                table = self.simple_read(grid, img, gray=gray)
+            else:
+                table = self.scan_read(grid, img, gray=gray)
         return table
 
-    def simple_read(self, columns_list: list, img: list) -> list:
+    def __read_crops(self, model: __Model, crops: list) -> list:
+        if self.batcher is None:
+            return read_in_groups(model, crops, batch_size=self.batch_size)
+        return self.batcher.submit(model, crops)
+
+    def __read_pages_batched(self, pages: list, margin: int = 2) -> list:
+        """
+        This method read cells of all pages together, pages is list of (gray image, grid),
+        crops of all pages are grouped by size and sent to recognizer in batches of batch_size.
+        For each page return list with list of strings for each model
+        """
+        # cut off borders of cells, table lines disturb recognizer
+        crops, owners = [], []
+        for idx_page, (gray, grid) in enumerate(pages):
+            boxes = grid.boxes
+            large = ((boxes[:, 2] > 2 * margin) & (boxes[:, 3] > 2 * margin))[:, None]
+            inner_boxes = np.where(large, boxes + [margin, margin, -2 * margin, -2 * margin], boxes).tolist()
+            crops += [gray[max(y, 0): y + h, max(x, 0): x + w] for x, y, w, h in inner_boxes]
+            owners += [idx_page] * len(inner_boxes)
+
+        models_out = []
+        for model in self.models:
+            if self.cache is None:
+                tracer.count(cells_ocr=len(crops))
+                out = self.__read_crops(model, crops)
+            else:
+                keys = [self.__cache_key(crop, model, 'boxes') for crop in crops]
+                out = [self.cache.get(key) for key in keys]
+
+                # only cells which aren't in cache are sent to recognizer
+                missed = [i for i, s in enumerate(out) if s is None]
+                tracer.count(cells_ocr=len(missed), cache_hits=len(out) - len(missed))
+                if len(missed) > 0:
+                    read = self.__read_crops(model, [crops[i] for i in missed])
+                    for i, s in zip(missed, read):
+                        out[i] = s
+                        self.cache.put(keys[i], s)
+            models_out.append(out)
+
+        # route strings back to pages
+        pages_out = [[[] for _ in self.models] for _ in pages]
+        for idx_model, out in enumerate(models_out):
+            for idx_page, s in zip(owners, out):
+                pages_out[idx_page][idx_model].append(s)
+        return pages_out
+
+    def reads_pages_together(self, method: str = 'simple') -> bool:
+        return method == 'simple' and self.batched
+
+    def read_cells_many(self, items: list, method: str = 'simple') -> list:
+        """
+        This method read cells of several pages, items is list of (grid, page).
+        In batched simple method cells of all pages share batches of recognizer, return list of tables
+        """
+        if not self.reads_pages_together(method):
+            return [self.read_cells(grid, page, method=method) for grid, page in items]
+
+        pages = []
+        for grid, page in items:
+            if not isinstance(grid, CellGrid):
+                grid = CellGrid.from_columns(grid)
+            gray = page.gray if isinstance(page, PreparedPage) else cv2.cvtColor(page, cv2.COLOR_BGR2GRAY)
+            pages.append((gray, grid))
+
+        with tracer.span('read_cells', cells=sum(grid.n_cols * grid.n_rows for _, grid in pages), pages=len(pages)):
+            with tracer.span('ocr_recognize'):
+                pages_out = self.__read_pages_batched(pages)
+            return [self.__simple_table(grid, None, iter(zip(*out))) for (_, grid), out in zip(pages, pages_out)]
+
+    def simple_read(self, grid: CellGrid, img: list, gray: list = None) -> list:
         """
         This method design for two model
         """
+        models_out = None
+        if self.batched:
+            if gray is None:
+                gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
+            with tracer.span('ocr_recognize'):
+                models_out = iter(zip(*self.__read_pages_batched([(gray, grid)])[0]))
+        return self.__simple_table(grid, img, models_out)
+
+    def __simple_table(self, grid: CellGrid, img: list, models_out: iter = None) -> list:
+        """
+        This method choose the best string of two models for every cell,
+        models_out is iterator of read strings of cells, if it is None, then cells are read one by one
+        """
         #  character filter
         reg = '[€@\|\&<>#\$\'\":\^\*\\/=_\!№;\?\~©\[\]\{\}°™“`«»]'
         pattern = re.compile(reg)
         p_ban_char = lambda s: pattern.search(s) is not None
 
         #  run by all cells in the table
-        table = [[] for i in range(len(columns_list))]
-        for index, col in enumerate(columns_list):
-            for cell in col:
-                x, y, w, h = cell
-                im = img[y: y + h, x:x + w]
-
+        table = [[] for i in range(grid.n_cols)]
+        for index in range(grid.n_cols):
+            for row in range(grid.n_rows):
                 # read cell both models
-                out = []
-                for model in self.models:
-                    out.append(model.simple_read(im))
+                if models_out is not None:
+                    out = next(models_out)
+                else:
+                    im = grid.crop(img, index, row)
+
+                    out = []
+                    with tracer.span('ocr_recognize'):
+                        for model in self.models:
+                            out.append(self.__cached_read(im, model, 'simple', lambda: model.simple_read(im)))
 
                 s1 = out[0]
                 s2 = out[-1]
@@ -121,16 +373,24 @@ class CellsReader(CellsReaderInterface):
 
         return table
 
-    def scan_read(self, columns_list: list, img: list) -> list:
+    def scan_read(self, grid: CellGrid, img: list, gray: list = None) -> list:
         """
         This method design for one model -- easyocr
         """
         if len(self.models) > 1 or self.models[0].name != 'easyocr':
             raise ValueError(f'Scan method support only easyocr model')
         model = self.models[0]
+        if gray is None:
+            gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
+
+        # text boxes don't depend on admissible set character, so detection run once
+        with tracer.span('ocr_detect') as span:
+            horizontal_list, free_list = model.detect(img, min_size=0)
+            span.count(detections=len(horizontal_list) + len(free_list))
         # run model on two admissible set character
-        scan1 = model.read_advance(img, allowlist=self.allow_list_all, detail=1, min_size=0)
-        scan2 = model.read_advance(img, allowlist=self.allow_list_num, detail=1, min_size=0)
+        with tracer.span('ocr_recognize'):
+            scan1 = model.recognize(gray, horizontal_list, free_list, allowlist=self.allow_list_all, detail=1)
+            scan2 = model.recognize(gray, horizontal_list, free_list, allowlist=self.allow_list_num, detail=1)
 
         # Choose the must confident prediction
         result = []
@@ -141,21 +401,20 @@ class CellsReader(CellsReaderInterface):
             else:
                 result.append(val2)
 
-        # helper method
-        def in_cell_check(val, cell, shift=5):
-            a, b, c, d = val[0]
-            x, y, w, h = cell
-            return x - shift <= a[0] <= x + w + shift and y - shift - 5 <= a[1] <= y + h + shift
+        # only confident strings are placed in cells, top left corner of box define cell of string
+        result = [val for val in result if val[2] >= 0.95]
+        points = np.array([val[0][0] for val in result], dtype=float).reshape(-1, 2)
+        matched = _match_detections(grid, points)
 
         # making an image of the table of read cells
-        image_table = [[] for _ in range(len(columns_list))]
+        image_table = [[] for _ in range(grid.n_cols)]
 
-        # run by columns in columns list
-        for idx_col, col in enumerate(columns_list):
+        # run by columns in grid
+        for idx_col in range(grid.n_cols):
             # run by elements in current column
-            for idx_cell, cell in enumerate(col):
+            for idx_cell in range(grid.n_rows):
                 #  find all read strings in current cell
-                in_cell_list = [val[1] for idx, val in enumerate(result) if in_cell_check(val, cell) and val[2] >= 0.95]
+                in_cell_list = [result[idx][1] for idx in matched[idx_col][idx_cell]]
                 # if in current cell not found string
                 if len(in_cell_list) == 0:
                     image_table[idx_col].append(None)
@@ -164,14 +423,18 @@ class CellsReader(CellsReaderInterface):
                     image_table[idx_col].append(s)
 
         #  making result table
-        table = [[] for i in range(len(columns_list))]
-        for idx_col, col in enumerate(columns_list):
-            for idx_cell, cell in enumerate(col):
+        table = [[] for i in range(grid.n_cols)]
+        for idx_col in range(grid.n_cols):
+            for idx_cell in range(grid.n_rows):
                 #  if in an image table in current cell no element, then read it separately
                 if (val := image_table[idx_col][idx_cell]) is None:
-                    x, y, w, h = cell
-                    im = img[y: y + h, x:x + w]
-                    s = ' '.join(model.read_advance(im, detail=0, allowlist=self.allow_list_num, min_size=0))
+                    im = grid.crop(img, idx_col, idx_cell)
+                    with tracer.span('ocr_recognize', fallback_reads=1):
+                        s = self.__cached_read(
+                            im, model, 'scan',
+                            lambda: ' '.join(model.read_advance(im, detail=0, allowlist=self.allow_list_num,
+                                                                min_size=0)),
+                            allowlist=self.allow_list_num)
                     table[idx_col].append(s)
                 else:
                     table[idx_col].append(val)
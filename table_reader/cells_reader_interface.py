@@ -1,7 +1,24 @@
 from abc import ABC, abstractmethod
 
+from table_reader.cell_grid import CellGrid
+from table_reader.image_processing import PreparedPage
+
 
 class CellsReaderInterface(ABC):
     @abstractmethod
-    def read_cells(self, columns_list: list, img: list) -> list:
+    def read_cells(self, grid: CellGrid, img: PreparedPage or list) -> list:
         pass
+
+    def reads_pages_together(self, method: str = 'simple') -> bool:
+        """
+        This method return True if read_cells_many share work between pages for this method,
+        otherwise pages are read one by one and there is no reason to collect them
+        """
+        return False
+
+    def read_cells_many(self, items: list, method: str = 'simple') -> list:
+        """
+        This method read cells of several pages, items is list of (grid, page), return list of tables.
+        Readers which can share work between pages override it and reads_pages_together
+        """
+        return [self.read_cells(grid, page, method=method) for grid, page in items]
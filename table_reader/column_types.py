@@ -0,0 +1,134 @@
+import numpy as np
+import pandas as pd
+
+# strings which mean empty cell in tables of measurements
+BLANKS = ('', '-', '--', '—', '–', 'nan', 'None')
+
+# number with groups of thousands separated by spaces, like '1 234,5'
+_GROUPED = r'-?\d{1,3}(?:[ \u00a0\u202f]\d{3})+(?:[.,]\d+)?'
+
+
+def _parse_numbers(raw: pd.Series) -> tuple:
+    """
+    This function parse column of strings as numbers with ',' or '.' decimal separator and spaces between
+    groups of thousands, return numbers (NaN where cell isn't number) and mask of empty cells.
+    Other strings with spaces aren't numbers: reader join several strings of one cell by space,
+    so '12 7' is two strings, not 127.
+    Columns of measurements have many repeated values, so only unique values are parsed
+    """
+    codes, uniques = pd.factorize(raw)
+    text = pd.Series(uniques, dtype=object).astype(str).str.strip()
+    blank = text.isin(BLANKS).to_numpy()
+    spaced = text.str.contains(r'\s', regex=True) & ~text.str.fullmatch(_GROUPED)
+    clean = text.where(~spaced).str.replace(r'\s', '', regex=True).str.replace(',', '.', regex=False)
+    numbers = pd.to_numeric(clean.where(~blank), errors='coerce').to_numpy(dtype=np.float64)
+    # inf and nan are words, not measurements
+    numbers[~np.isfinite(numbers)] = np.nan
+
+    # missing values have code -1
+    missing = codes < 0
+    codes = np.where(missing, 0, codes)
+    if len(uniques) == 0:
+        return np.full(len(raw), np.nan), np.ones(len(raw), dtype=bool)
+    return np.where(missing, np.nan, numbers[codes]), missing | blank[codes]
+
+
+def infer_types(df: pd.DataFrame, numeric_share: float = 0.8, category_share: float = 0.5) -> pd.DataFrame:
+    """
+    This function convert columns of strings to types:
+    column where at least numeric_share of not empty cells are numbers become Int64 (if all numbers are integer)
+    or float64, empty cells and cells which aren't numbers become NA;
+    column where number of unique values is at most category_share of not empty cells become category.
+    Original strings of not parsed cells of numeric columns are kept in df.attrs['parse_errors']
+    as {column: {row position: string}}, use parse_error_mask to get mask of them
+    """
+    columns = {}
+    parse_errors = {}
+    for i, name in enumerate(df.columns):
+        raw = df.iloc[:, i]
+        if raw.dtype != object:
+            columns[i] = raw
+            continue
+
+        numbers, blank = _parse_numbers(raw)
+        filled = int((~blank).sum())
+        parsed = ~np.isnan(numbers)
+        if filled > 0 and parsed.sum() >= numeric_share * filled:
+            failed = np.flatnonzero(~blank & ~parsed)
+            if len(failed) > 0:
+                parse_errors[name] = {int(row): str(raw.iat[row]) for row in failed}
+            values = numbers[parsed]
+            if np.all(values == np.round(values)) and np.all(np.abs(values) < 2 ** 53):
+                columns[i] = pd.Series(numbers, index=df.index).astype('Int64')
+            else:
+                columns[i] = pd.Series(numbers, index=df.index)
+        elif filled > 1 and raw[~blank].nunique() <= category_share * filled:
+            columns[i] = raw.astype('category')
+        else:
+            columns[i] = raw
+
+    typed = pd.DataFrame(columns, index=df.index)
+    # columns are kept by position, so columns with the same names aren't lost
+    typed.columns = df.columns
+    typed.attrs['parse_errors'] = parse_errors
+    return typed
+
+
+def parse_error_mask(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    This function return boolean DataFrame, where True marks cell which couldn't be parsed to type of its column
+    """
+    mask = np.zeros(df.shape, dtype=bool)
+    positions = {name: i for i, name in enumerate(df.columns)}
+    for name, rows in df.attrs.get('parse_errors', {}).items():
+        if name in positions:
+            mask[list(rows), positions[name]] = True
+    return pd.DataFrame(mask, index=df.index, columns=df.columns)
+
+
+def parse_errors_table(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    This function return table of not parsed cells: row (label of index), column and original string
+    """
+    records = [(df.index[row], name, raw) for name, rows in df.attrs.get('parse_errors', {}).items()
+               for row, raw in rows.items() if row < len(df)]
+    return pd.DataFrame(records, columns=['row', 'column', 'text'])
+
+
+def keep_parse_errors(df: pd.DataFrame, edited: pd.DataFrame) -> pd.DataFrame:
+    """
+    This function copy not parsed cells of df to edited copy of df, because editors (like st.data_editor)
+    return table without attrs. Cells which were filled by user aren't errors anymore
+    """
+    positions = {name: i for i, name in enumerate(edited.columns)}
+    errors = {}
+    for name, rows in df.attrs.get('parse_errors', {}).items():
+        if name not in positions:
+            continue
+        column = edited.iloc[:, positions[name]]
+        rows = {row: raw for row, raw in rows.items() if row < len(column) and pd.isna(column.iat[row])}
+        if rows:
+            errors[name] = rows
+    edited.attrs['parse_errors'] = errors
+    return edited
+
+
+def with_raw_text(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    This function return copy of df, where not parsed cells contain their original strings,
+    so misread cells can be found and fixed in exported file. Columns with such cells become object
+    """
+    errors = df.attrs.get('parse_errors', {})
+    if not errors:
+        return df
+    df = df.copy(deep=False)
+    positions = {name: i for i, name in enumerate(df.columns)}
+    for name, rows in errors.items():
+        if name not in positions:
+            continue
+        i = positions[name]
+        column = df.iloc[:, i].astype(object)
+        rows = [row for row in rows if row < len(column)]
+        column.iloc[rows] = [errors[name][row] for row in rows]
+        df.isetitem(i, column)
+    return df
@@ -0,0 +1,114 @@
+import io
+import re
+import zipfile
+
+import pandas as pd
+import xlsxwriter
+
+from table_reader.column_types import with_raw_text
+
+FORMATS = {'xlsx': 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
+           'csv': 'text/csv',
+           'parquet': 'application/octet-stream'}
+
+
+def _sheet_names(names: list) -> list:
+    """
+    This function make valid and unique names of excel sheets: not longer 31 symbols and without []:*?/\\
+    """
+    result = []
+    used = set()
+    for name in names:
+        base = re.sub(r'[\[\]:*?/\\]', '_', str(name)).strip("'")[:31] or 'Sheet'
+        sheet, idx = base, 1
+        while sheet.lower() in used:
+            suffix = f' ({idx})'
+            sheet = base[:31 - len(suffix)] + suffix
+            idx += 1
+        used.add(sheet.lower())
+        result.append(sheet)
+    return result
+
+
+def write_xlsx(tables: list, output, chunk_size: int = 10000):
+    """
+    This function write tables (list of (name, DataFrame)) as sheets of one workbook.
+    Workbook is in constant memory mode: rows are written one by one and flushed to disk,
+    so memory doesn't grow with size of tables
+    """
+    workbook = xlsxwriter.Workbook(output, {'constant_memory': True, 'default_date_format': 'yyyy-mm-dd'})
+    try:
+        for sheet, (_, df) in zip(_sheet_names([name for name, _ in tables]), tables):
+            worksheet = workbook.add_worksheet(sheet)
+            worksheet.write_row(0, 0, [str(col) for col in df.columns])
+            for start in range(0, len(df), chunk_size):
+                chunk = df.iloc[start: start + chunk_size]
+                # empty values are written as blank cells, excel doesn't support NaN
+                values = chunk.astype(object).where(chunk.notna(), None).to_numpy()
+                for i, row in enumerate(values, start + 1):
+                    worksheet.write_row(i, 0, row)
+    finally:
+        workbook.close()
+
+
+def _csv_bytes(df: pd.DataFrame) -> bytes:
+    # BOM is needed for excel to open not ascii text in csv right
+    return df.to_csv(index=False).encode('utf-8-sig')
+
+
+def _parquet_bytes(df: pd.DataFrame) -> bytes:
+    output = io.BytesIO()
+    df = df.copy(deep=False)
+    # parquet need string names of columns
+    df.columns = [str(col) for col in df.columns]
+    df.to_parquet(output, index=False)
+    return output.getvalue()
+
+
+def write_table(name: str, df: pd.DataFrame, output, fmt: str = 'xlsx'):
+    """
+    This function write one table to output (path or binary file) like export_tables write it:
+    in xlsx and csv not parsed cells of numeric columns contain original strings
+    """
+    if fmt not in FORMATS:
+        raise ValueError(f'Unknown format ({fmt}). \nAvailable formats: {", ".join(FORMATS)}')
+    if fmt != 'parquet':
+        df = with_raw_text(df)
+
+    if fmt == 'xlsx':
+        write_xlsx([(name, df)], output)
+        return
+    data = _csv_bytes(df) if fmt == 'csv' else _parquet_bytes(df)
+    if isinstance(output, str):
+        with open(output, 'wb') as f:
+            f.write(data)
+    else:
+        output.write(data)
+
+
+def export_tables(tables: list, fmt: str = 'xlsx') -> tuple:
+    """
+    This function return content of file, extension and mime type for tables (list of (name, DataFrame)).
+    xlsx is one workbook with sheet per table, csv and parquet are one file for one table and zip archive
+    with file per table for several tables.
+    In xlsx and csv not parsed cells of numeric columns contain original strings, parquet keep types of columns
+    """
+    if fmt not in FORMATS:
+        raise ValueError(f'Unknown format ({fmt}). \nAvailable formats: {", ".join(FORMATS)}')
+    if fmt != 'parquet':
+        tables = [(name, with_raw_text(df)) for name, df in tables]
+
+    if fmt == 'xlsx':
+        output = io.BytesIO()
+        write_xlsx(tables, output)
+        return output.getvalue(), 'xlsx', FORMATS['xlsx']
+
+    to_bytes = _csv_bytes if fmt == 'csv' else _parquet_bytes
+    if len(tables) == 1:
+        return to_bytes(tables[0][1]), fmt, FORMATS[fmt]
+
+    output = io.BytesIO()
+    with zipfile.ZipFile(output, 'w', compression=zipfile.ZIP_DEFLATED) as archive:
+        for name, (_, df) in zip(_sheet_names([name for name, _ in tables]), tables):
+            archive.writestr(f'{name}.{fmt}', to_bytes(df))
+    return output.getvalue(), 'zip', 'application/zip'
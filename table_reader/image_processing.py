@@ -1,15 +1,50 @@
 import cv2
 import numpy as np
 
+from table_reader.tracing import tracer
 
-def align_image(img: np.array) -> np.array:
+
+def binarize(gray: np.array) -> np.array:
     """
-    This method align image find corner table and performs affine transform
+    This function is default threshold function, it return inverted binary image via adaptive threshold
+    """
+    return cv2.adaptiveThreshold(gray, 255,
+                                 cv2.ADAPTIVE_THRESH_GAUSSIAN_C,
+                                 cv2.THRESH_BINARY_INV, 11, 2)
+
+
+class PreparedPage:
+    """
+    This class contain page which aligned only once and then shared between cells extractor and cells reader:
+    aligned image (BGR and gray), binary aligned image and matrix of perspective transform.
+    Binary image is made on first use, so it isn't made if nobody needs it
+    """
+
+    def __init__(self, image: np.array, gray: np.array, matrix: np.array, threshold_func: callable = binarize):
+        self.image = image
+        self.gray = gray
+        self.matrix = matrix
+        self.threshold_func = threshold_func
+        self.__binary = None
+
+    @property
+    def binary(self) -> np.array:
+        if self.__binary is None:
+            with tracer.span('threshold'):
+                self.__binary = self.threshold_func(self.gray)
+        return self.__binary
+
+    @property
+    def shape(self) -> tuple:
+        return self.image.shape
+
+
+def _warp(img: np.array, gray: np.array) -> tuple:
     """
-    gray = cv2.cvtColor(img.copy(), cv2.COLOR_BGR2GRAY)
-    binary_img = cv2.adaptiveThreshold(gray, 255,
-                                       cv2.ADAPTIVE_THRESH_GAUSSIAN_C,
-                                       cv2.THRESH_BINARY_INV, 11, 2)
+    This function find corner table and performs affine transform,
+    return aligned image and matrix of the transform
+    """
+    binary_img = binarize(gray)
 
     contours, _ = cv2.findContours(binary_img,
                                    method=cv2.CHAIN_APPROX_SIMPLE,
@@ -56,4 +91,27 @@ def align_image(img: np.array) -> np.array:
 
     cv2.rectangle(dst, (2, 2), (height - 2, width - 2), color=(0, 0, 0), thickness=2)
 
+    return dst, M
+
+
+def align_image(img: np.array) -> np.array:
+    """
+    This method align image find corner table and performs affine transform
+    """
+    gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
+    dst, _ = _warp(img, gray)
     return dst
+
+
+def prepare_page(img: np.array, threshold_func: callable = binarize) -> PreparedPage:
+    """
+    This function align image once, binary aligned image is made once on first use,
+    so next steps of the pipeline don't repeat this work
+    """
+    with tracer.span('align'):
+        gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
+        dst, M = _warp(img, gray)
+
+        dst_gray = cv2.cvtColor(dst, cv2.COLOR_BGR2GRAY)
+
+    return PreparedPage(image=dst, gray=dst_gray, matrix=M, threshold_func=threshold_func)
@@ -0,0 +1,128 @@
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+import cv2
+import numpy as np
+
+from table_reader.table_process import TableReader
+from table_reader.tracing import tracer
+
+
+class Job:
+    """
+    This class keep state of reading of one file: status (queued, running, done, error),
+    progress (read pages, number of pages, read cells) and result
+    """
+
+    def __init__(self, name: str, session_id: str):
+        self.id = uuid.uuid4().hex
+        self.name = name
+        self.session_id = session_id
+        self.status = 'queued'
+        self.pages_done = 0
+        self.n_pages = None
+        self.cells_done = 0
+        self.result = None
+        self.records = []
+        self.error = None
+        self.created = time.time()
+        self.finished = None
+
+    def progress(self, pages_done: int, n_pages: int, cells_done: int):
+        self.pages_done = pages_done
+        self.n_pages = n_pages
+        self.cells_done = cells_done
+
+    @property
+    def fraction(self) -> float:
+        if self.status == 'done':
+            return 1.0
+        if not self.n_pages:
+            return 0.0
+        return min(self.pages_done / self.n_pages, 1.0)
+
+    @property
+    def is_finished(self) -> bool:
+        return self.status in ('done', 'error')
+
+
+class JobManager:
+    """
+    This class read files in background threads, so reading outlive reruns of the streamlit script.
+    Jobs are kept by session, finished jobs are given to their session once by pop_finished
+    """
+
+    def __init__(self, reader: TableReader, max_workers: int = 2, max_age: float = 3600):
+        """
+        max_workers -- number of files read at the same time
+        max_age -- seconds after which not taken result of closed session is removed
+        """
+        self.reader = reader
+        self.max_workers = max_workers
+        self.max_age = max_age
+        self.__executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='table-job')
+        self.__jobs = {}
+        self.__lock = threading.Lock()
+
+    def __run(self, job: Job, file: bytes, is_pdf: bool, trace: bool):
+        job.status = 'running'
+        try:
+            if not is_pdf:
+                file = cv2.imdecode(np.frombuffer(file, dtype=np.uint8), cv2.IMREAD_COLOR)
+                if file is None:
+                    raise ValueError('File is not an image')
+            if trace:
+                with tracer.collect() as records:
+                    job.result = self.reader.read(file, is_pdf=is_pdf, progress=job.progress)
+                job.records = records
+            else:
+                job.result = self.reader.read(file, is_pdf=is_pdf, progress=job.progress)
+            status = 'done'
+        except Exception as e:
+            job.error = f'{type(e).__name__}: {e}'
+            status = 'error'
+        # status is changed the last, so finished job always has all fields
+        job.finished = time.time()
+        job.status = status
+
+    def submit(self, session_id: str, name: str, file: bytes, is_pdf: bool, trace: bool = False) -> Job:
+        """
+        This method add file to queue of reading, file is content of pdf or encoded image,
+        if trace is True, then spans of the pipeline are kept in job.records
+        """
+        job = Job(name, session_id)
+        with self.__lock:
+            self.__forget_old(self.max_age)
+            self.__jobs.setdefault(session_id, {})[job.id] = job
+        self.__executor.submit(self.__run, job, file, is_pdf, trace)
+        return job
+
+    def jobs(self, session_id: str) -> list:
+        with self.__lock:
+            return list(self.__jobs.get(session_id, {}).values())
+
+    def pop_finished(self, session_id: str) -> list:
+        """
+        This method return finished jobs of session and forget them
+        """
+        with self.__lock:
+            session_jobs = self.__jobs.get(session_id, {})
+            finished = [job for job in session_jobs.values() if job.is_finished]
+            for job in finished:
+                del session_jobs[job.id]
+        return finished
+
+    def __forget_old(self, max_age: float):
+        """
+        This method remove finished jobs which nobody took during max_age seconds, their sessions are closed
+        """
+        now = time.time()
+        for session_id in list(self.__jobs):
+            session_jobs = self.__jobs[session_id]
+            for job_id in [job_id for job_id, job in session_jobs.items()
+                           if job.is_finished and now - job.finished > max_age]:
+                del session_jobs[job_id]
+            if not session_jobs:
+                del self.__jobs[session_id]
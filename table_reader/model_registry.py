@@ -0,0 +1,41 @@
+import threading
+import time
+
+
+class ModelRegistry:
+    """
+    This class load OCR models on first use and keep them loaded until end of the process,
+    time spent on loading of every model is saved in load_time
+    """
+
+    def __init__(self):
+        self.__models = {}
+        self.__lock = threading.Lock()
+        self.load_time = {}
+
+    @staticmethod
+    def __load(name: str, lang: tuple) -> object:
+        if name == 'easyocr':
+            # easyocr import torch, so it is imported only when model is really needed
+            import easyocr
+            return easyocr.Reader(list(lang))
+        raise ValueError(f'Unknown model ({name}). \nAvailable models: easyocr')
+
+    def get(self, name: str, lang: list) -> object:
+        """
+        This method return loaded model, model is loaded if it is first request of the model
+        """
+        key = (name, tuple(lang))
+        with self.__lock:
+            if key not in self.__models:
+                start = time.perf_counter()
+                self.__models[key] = self.__load(name, key[1])
+                self.load_time[key] = time.perf_counter() - start
+            return self.__models[key]
+
+    def is_loaded(self, name: str, lang: list) -> bool:
+        return (name, tuple(lang)) in self.__models
+
+
+# models shared by all readers of the process
+registry = ModelRegistry()
@@ -0,0 +1,240 @@
+"""
+Local HTTP service of table reader, it works offline, OCR models must be downloaded before.
+
+Run from the root of the repository:
+    python -m table_reader.service --port 8000 --workers 4
+
+API:
+    POST /jobs          body is pdf or image file, answer 202 {"id": ...} or 429 if queue is full
+    GET  /jobs/<id>     status of job: queued, running, done or error, done job has table {"columns", "data"}
+    GET  /health        size of queue, number of running jobs and statistic of recognizer batches
+
+Cells of pages read by concurrent jobs are merged into shared batches of recognizer (see CropBatcher),
+recognizer read them in real batches on cpu too and use all cores for one batch.
+With --no-batcher every worker call recognizer itself, it is the baseline for load test.
+"""
+import argparse
+import asyncio
+import json
+import time
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+import cv2
+import numpy as np
+
+from table_reader.batching import CropBatcher
+from table_reader.cells_extractor import CellsExtractor
+from table_reader.cells_reader import CellsReader
+from table_reader.table_process import TableReader
+
+_REASONS = {200: 'OK', 202: 'Accepted', 400: 'Bad Request', 404: 'Not Found', 405: 'Method Not Allowed',
+            413: 'Payload Too Large', 429: 'Too Many Requests', 500: 'Internal Server Error'}
+
+# first bytes of pdf and of image formats which opencv decode
+_SIGNATURES = {b'%PDF-': 'pdf', b'\xff\xd8\xff': 'image', b'\x89PNG\r\n\x1a\n': 'image', b'BM': 'image',
+               b'II*\x00': 'image', b'MM\x00*': 'image'}
+
+
+def _file_kind(body: bytes) -> str or None:
+    """
+    This function return 'pdf' or 'image' by first bytes of file, None if file is neither
+    """
+    for signature, kind in _SIGNATURES.items():
+        if body.startswith(signature):
+            return kind
+    if body[:4] == b'RIFF' and body[8:12] == b'WEBP':
+        return 'image'
+    return None
+
+
+def _read_file(reader: TableReader, body: bytes, is_pdf: bool):
+    """
+    This function decode image and read table, it is run in thread of worker, not in event loop
+    """
+    if not is_pdf:
+        try:
+            img = cv2.imdecode(np.frombuffer(body, dtype=np.uint8), cv2.IMREAD_COLOR)
+        except cv2.error:
+            img = None
+        if img is None:
+            raise ValueError('File is broken image')
+        body = img
+    return reader.read(body, is_pdf)
+
+
+class TableService:
+    """
+    This class accept files over HTTP, keep them in bounded queue and read them by several workers,
+    when queue is full, new files are rejected with 429, so clients slow down instead of overloading the service
+    """
+
+    def __init__(self, reader: TableReader, workers: int = 2, max_queue: int = 16,
+                 max_body: int = 50 * 2 ** 20, max_jobs: int = 1000):
+        """
+        workers -- number of files read at the same time
+        max_queue -- number of files which can wait in queue
+        max_body -- maximal size of file in bytes
+        max_jobs -- number of jobs which are kept for polling, the oldest finished jobs are forgotten
+        """
+        self.reader = reader
+        self.workers = workers
+        self.max_queue = max_queue
+        self.max_body = max_body
+        self.max_jobs = max_jobs
+        self.jobs = OrderedDict()
+        self.running = 0
+        self.__queue = None
+        self.__executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='table-reader')
+
+    async def __worker(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            job_id, file, is_pdf = await self.__queue.get()
+            job = self.jobs[job_id]
+            job.update(status='running', started=time.time())
+            self.running += 1
+            try:
+                df = await loop.run_in_executor(self.__executor, _read_file, self.reader, file, is_pdf)
+                job.update(status='done', table=json.loads(df.to_json(orient='split', index=False,
+                                                                      force_ascii=False)))
+            except Exception as e:
+                job.update(status='error', error=f'{type(e).__name__}: {e}')
+            finally:
+                self.running -= 1
+                job['finished'] = time.time()
+                self.__queue.task_done()
+
+    def __forget_old_jobs(self):
+        finished = [job_id for job_id, job in self.jobs.items() if job['status'] in ('done', 'error')]
+        for job_id in finished[:max(0, len(self.jobs) - self.max_jobs)]:
+            del self.jobs[job_id]
+
+    def __submit(self, body: bytes) -> tuple:
+        if len(body) == 0:
+            return 400, {'error': 'Empty file'}
+        # only first bytes are checked here, image is decoded by worker, so event loop is never blocked
+        kind = _file_kind(body)
+        if kind is None:
+            return 400, {'error': 'File is neither pdf nor image'}
+
+        job_id = uuid.uuid4().hex
+        try:
+            self.__queue.put_nowait((job_id, body, kind == 'pdf'))
+        except asyncio.QueueFull:
+            return 429, {'error': 'Queue is full, try later'}
+        self.jobs[job_id] = {'id': job_id, 'status': 'queued', 'created': time.time()}
+        self.__forget_old_jobs()
+        return 202, {'id': job_id}
+
+    def __health(self) -> dict:
+        batcher = getattr(self.reader.cell_reader, 'batcher', None)
+        return {'queued': self.__queue.qsize(), 'max_queue': self.max_queue, 'running': self.running,
+                'batcher': batcher.stats() if batcher is not None else None}
+
+    async def __route(self, method: str, path: str, body: bytes) -> tuple:
+        path = path.split('?', 1)[0].rstrip('/')
+        if path == '/jobs':
+            if method != 'POST':
+                return 405, {'error': 'Use POST'}
+            return self.__submit(body)
+        if path.startswith('/jobs/'):
+            if method != 'GET':
+                return 405, {'error': 'Use GET'}
+            job = self.jobs.get(path[len('/jobs/'):])
+            if job is None:
+                return 404, {'error': 'Unknown job'}
+            return 200, job
+        if path == '/health':
+            return 200, self.__health()
+        return 404, {'error': 'Unknown path'}
+
+    async def handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        """
+        This method serve one HTTP/1.1 request, connection is closed after response
+        """
+        try:
+            try:
+                head = await reader.readuntil(b'\r\n\r\n')
+                request_line, *header_lines = head.decode('latin-1').split('\r\n')
+                method, path, _ = request_line.split(' ', 2)
+                headers = {}
+                for line in header_lines:
+                    if ':' in line:
+                        name, value = line.split(':', 1)
+                        headers[name.strip().lower()] = value.strip()
+                length = int(headers.get('content-length', 0))
+            except (asyncio.IncompleteReadError, asyncio.LimitOverrunError, ValueError):
+                status, answer = 400, {'error': 'Bad request'}
+            else:
+                if length > self.max_body:
+                    status, answer = 413, {'error': f'File is larger than {self.max_body} bytes'}
+                else:
+                    body = await reader.readexactly(length) if length > 0 else b''
+                    try:
+                        status, answer = await self.__route(method, path, body)
+                    except Exception as e:
+                        # client always get answer, connection isn't dropped
+                        status, answer = 500, {'error': f'{type(e).__name__}: {e}'}
+
+            data = json.dumps(answer, ensure_ascii=False).encode('utf-8')
+            extra = 'Retry-After: 1\r\n' if status == 429 else ''
+            writer.write(f'HTTP/1.1 {status} {_REASONS[status]}\r\n'
+                         f'Content-Type: application/json; charset=utf-8\r\n'
+                         f'Content-Length: {len(data)}\r\n{extra}'
+                         f'Connection: close\r\n\r\n'.encode('latin-1') + data)
+            await writer.drain()
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    async def serve(self, host: str = '127.0.0.1', port: int = 8000):
+        self.__queue = asyncio.Queue(maxsize=self.max_queue)
+        workers = [asyncio.create_task(self.__worker()) for _ in range(self.workers)]
+        server = await asyncio.start_server(self.handle, host, port)
+        print(f'Table reader service is listening on http://{host}:{port}')
+        try:
+            async with server:
+                await server.serve_forever()
+        finally:
+            for worker in workers:
+                worker.cancel()
+            self.__executor.shutdown(cancel_futures=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8000)
+    parser.add_argument('--workers', type=int, default=2, help='number of files read at the same time')
+    parser.add_argument('--max-queue', type=int, default=16, help='number of files which can wait in queue')
+    parser.add_argument('--max-batch', type=int, default=256, help='number of crops in shared batch')
+    parser.add_argument('--max-wait', type=float, default=0.05, help='seconds crops wait for other requests')
+    parser.add_argument('--batch-size', type=int, default=16, help='number of crops in one call of recognizer')
+    parser.add_argument('--no-batcher', action='store_true', help='workers read their crops without shared batches')
+    parser.add_argument('--lang', nargs='+', default=['ru', 'en'], help='languages of OCR model')
+    args = parser.parse_args()
+
+    # scan method detect text on every page separately, so only simple method can share batches
+    batcher = None
+    if not args.no_batcher:
+        batcher = CropBatcher(max_batch=args.max_batch, max_wait=args.max_wait, batch_size=args.batch_size)
+    cell_reader = CellsReader(model='easyocr', lang=args.lang, batched=True, batch_size=args.batch_size,
+                              batcher=batcher)
+    cell_reader.warm_up()
+    reader = TableReader(cell_extractor=CellsExtractor(), cell_reader=cell_reader, method='simple')
+
+    service = TableService(reader, workers=args.workers, max_queue=args.max_queue)
+    try:
+        asyncio.run(service.serve(args.host, args.port))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        if batcher is not None:
+            batcher.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,161 @@
+import hashlib
+import threading
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+
+NUMERIC_STATS = ('count', 'missing', 'mean', 'std', 'min', '25%', '50%', '75%', 'max')
+LABEL_STATS = ('count', 'missing', 'unique', 'top', 'freq')
+
+
+def column_key(column: pd.Series) -> str:
+    """
+    This function return digest of name, type and values of column,
+    the same column in edited table has the same key, so its statistics aren't computed again
+    """
+    h = hashlib.blake2b(digest_size=16)
+    h.update(f'{column.name}|{column.dtype}|{len(column)}'.encode())
+    if len(column) > 0:
+        h.update(pd.util.hash_pandas_object(column, index=False).to_numpy().tobytes())
+    return h.hexdigest()
+
+
+def is_numeric(column: pd.Series) -> bool:
+    return pd.api.types.is_numeric_dtype(column) and not pd.api.types.is_bool_dtype(column)
+
+
+def _numbers(column: pd.Series) -> np.array:
+    # nullable integers keep NA, it is NaN in float array
+    return column.to_numpy(dtype=np.float64, na_value=np.nan)
+
+
+def _describe_column(column: pd.Series) -> dict:
+    if is_numeric(column):
+        values = _numbers(column)
+        values = values[~np.isnan(values)]
+        stats = {'count': len(values), 'missing': len(column) - len(values)}
+        if len(values) == 0:
+            return {**dict.fromkeys(NUMERIC_STATS, np.nan), **stats}
+        q25, q50, q75 = np.percentile(values, [25, 50, 75])
+        return {**stats,
+                'mean': values.mean(), 'std': values.std(ddof=1) if len(values) > 1 else np.nan,
+                'min': values.min(), '25%': q25, '50%': q50, '75%': q75, 'max': values.max()}
+
+    codes, uniques = pd.factorize(column)
+    filled = codes[codes >= 0]
+    stats = {'count': len(filled), 'missing': len(codes) - len(filled), 'unique': len(uniques)}
+    if len(filled) == 0:
+        return {**stats, 'top': None, 'freq': 0}
+    counts = np.bincount(filled, minlength=len(uniques))
+    return {**stats, 'top': uniques[counts.argmax()], 'freq': int(counts.max())}
+
+
+def _correlation(a: np.array, b: np.array) -> float:
+    """
+    This function return Pearson correlation of two columns over rows where both values are present
+    """
+    valid = ~np.isnan(a) & ~np.isnan(b)
+    if valid.sum() < 2:
+        return np.nan
+    a, b = a[valid] - a[valid].mean(), b[valid] - b[valid].mean()
+    norm = np.sqrt((a * a).sum() * (b * b).sum())
+    return float((a * b).sum() / norm) if norm > 0 else np.nan
+
+
+class TableStatistics:
+    """
+    This class compute statistics of tables and keep them by keys of columns:
+    descriptive statistics of each column, correlation of each pair of numeric columns and group-by summaries.
+    If user edit some cells, then only statistics of changed columns are computed again
+    """
+
+    def __init__(self, max_items: int = 10000):
+        self.max_items = max_items
+        self.__cache = OrderedDict()
+        self.__lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def __cached(self, key: tuple, compute: callable):
+        with self.__lock:
+            if key in self.__cache:
+                self.__cache.move_to_end(key)
+                self.hits += 1
+                return self.__cache[key]
+        value = compute()
+        with self.__lock:
+            self.misses += 1
+            self.__cache[key] = value
+            while len(self.__cache) > self.max_items:
+                self.__cache.popitem(last=False)
+        return value
+
+    @staticmethod
+    def __keys(df: pd.DataFrame) -> list:
+        return [column_key(df.iloc[:, i]) for i in range(df.shape[1])]
+
+    def describe(self, df: pd.DataFrame, keys: list = None) -> tuple:
+        """
+        This method return two DataFrames: statistics of numeric columns and statistics of other columns,
+        rows are columns of the table
+        """
+        keys = self.__keys(df) if keys is None else keys
+        numeric, labels = {}, {}
+        for i, key in enumerate(keys):
+            column = df.iloc[:, i]
+            stats = self.__cached(('describe', key), lambda: _describe_column(column))
+            (numeric if is_numeric(column) else labels)[column.name] = stats
+        return (pd.DataFrame.from_dict(numeric, orient='index', columns=list(NUMERIC_STATS)),
+                pd.DataFrame.from_dict(labels, orient='index', columns=list(LABEL_STATS)))
+
+    def correlation(self, df: pd.DataFrame, keys: list = None) -> pd.DataFrame:
+        """
+        This method return matrix of Pearson correlation of numeric columns,
+        correlation of pair is computed only if one of two columns is new or changed
+        """
+        keys = self.__keys(df) if keys is None else keys
+        idx = [i for i in range(df.shape[1]) if is_numeric(df.iloc[:, i])]
+        names = [df.columns[i] for i in idx]
+        values = {}
+        matrix = np.eye(len(idx))
+        for a in range(len(idx)):
+            for b in range(a + 1, len(idx)):
+                key_a, key_b = sorted((keys[idx[a]], keys[idx[b]]))
+
+                def compute():
+                    for i in (idx[a], idx[b]):
+                        if i not in values:
+                            values[i] = _numbers(df.iloc[:, i])
+                    return _correlation(values[idx[a]], values[idx[b]])
+
+                matrix[a, b] = matrix[b, a] = self.__cached(('corr', key_a, key_b), compute)
+        return pd.DataFrame(matrix, index=names, columns=names)
+
+    def group_by(self, df: pd.DataFrame, by: str, columns: list, keys: list = None) -> pd.DataFrame:
+        """
+        This method return count, mean, std, min and max of numeric columns for every value of column by
+        """
+        keys = self.__keys(df) if keys is None else keys
+        position = {name: i for i, name in enumerate(df.columns)}
+        key = ('group_by', keys[position[by]], tuple(keys[position[name]] for name in columns))
+
+        def compute():
+            data = df[[by, *columns]].copy()
+            for name in columns:
+                data[name] = _numbers(data[name])
+            return data.groupby(by, observed=True, sort=True)[columns].agg(['count', 'mean', 'std', 'min', 'max'])
+
+        return self.__cached(key, compute)
+
+    def keys(self, df: pd.DataFrame, fingerprint: str = None) -> list:
+        """
+        This method return keys of columns, they can be passed to other methods, so columns are hashed once,
+        if fingerprint of table is given, then columns of already seen table aren't hashed at all
+        """
+        if fingerprint is None:
+            return self.__keys(df)
+        return self.__cached(('keys', fingerprint), lambda: self.__keys(df))
+
+    def stats(self) -> dict:
+        return {'hits': self.hits, 'misses': self.misses, 'items': len(self.__cache)}
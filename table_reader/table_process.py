@@ -1,16 +1,28 @@
+import multiprocessing
+import os
+import tempfile
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
 import pandas as pd
-from pdf2image import convert_from_bytes
+from pdf2image import convert_from_path, pdfinfo_from_path
 import numpy as np
 
+from table_reader.cache import DocumentCache
 from table_reader.table_reader_interface import TableReaderInterface
 from table_reader.cells_extractor_interface import CellsExtractorInterface
 from table_reader.cells_extractor import CellsExtractor
 from table_reader.cells_reader_interface import CellsReaderInterface
 from table_reader.cells_reader import CellsReader
-from table_reader.image_processing import align_image
+from table_reader.column_types import infer_types
+from table_reader.tracing import tracer
 
 
-def _list_to_pandas(table: list) -> pd.DataFrame:
+def _list_to_pandas(table: list, typed: bool = True) -> pd.DataFrame:
+    """
+    This function make DataFrame from list of columns, first cell of column is its name,
+    if typed is True, then numeric columns and columns with repeated labels are converted (see infer_types)
+    """
     d = {}
 
     idx = 0
@@ -22,42 +34,281 @@ def _list_to_pandas(table: list) -> pd.DataFrame:
         d[key] = col[1::]
 
     table_pd = pd.DataFrame(data=d)
+    if typed:
+        table_pd = infer_types(table_pd)
     return table_pd
 
 
+def _describe(obj: object) -> str:
+    """
+    This function describe settings of pipeline part, they are part of key of cached document
+    """
+    def is_plain(value):
+        if isinstance(value, (list, tuple)):
+            return all(is_plain(v) for v in value)
+        return isinstance(value, (str, int, float, bool, type(None)))
+
+    settings = {}
+    for name, value in sorted(vars(obj).items()):
+        if is_plain(value):
+            settings[name] = value
+        elif callable(value):
+            settings[name] = getattr(value, '__qualname__', type(value).__name__)
+    return f'{type(obj).__name__}{settings}'
+
+
+def _count_cells(df: pd.DataFrame) -> int:
+    # first row of the table is header of DataFrame
+    return (len(df) + 1) * len(df.columns) if len(df.columns) > 0 else 0
+
+
+def _iter_pdf_pages(pdf: bytes, on_open: callable = None):
+    """
+    This generator render pdf page by page, so in memory there is only one rendered page at the moment,
+    on_open is called with number of pages before the first page
+    """
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        path = os.path.join(tmp_dir, 'document.pdf')
+        with open(path, 'wb') as f:
+            f.write(pdf)
+
+        n_pages = pdfinfo_from_path(path)['Pages']
+        if on_open is not None:
+            on_open(n_pages)
+        for number in range(1, n_pages + 1):
+            page = convert_from_path(path, first_page=number, last_page=number)[0]
+            img = np.array(page)
+            page.close()
+            yield img
+
+
+# table reader of the current worker process, it is created once per process in _init_worker
+_worker_reader = None
+
+
+def _init_worker(cell_extractor: CellsExtractorInterface,
+                 cell_reader: CellsReaderInterface,
+                 n_threads: int,
+                 method: str = 'scan'):
+    """
+    This function run once in each worker process, models are loaded here and kept until process end
+    """
+    global _worker_reader
+    # spans of the worker are sent to the main process, so observers of the main process get them
+    tracer.reset()
+    try:
+        import torch
+        # workers must not fight for the same cores
+        torch.set_num_threads(n_threads)
+    except ImportError:
+        pass
+    _worker_reader = TableReader(cell_extractor=cell_extractor, cell_reader=cell_reader, method=method)
+    # load models before the first page
+    warm_up = getattr(cell_reader, 'warm_up', None)
+    if warm_up is not None:
+        warm_up()
+
+
+def _read_page_in_worker(img: np.array, trace: bool = False) -> tuple:
+    """
+    This function return DataFrame of the page and records of spans, if trace is True
+    """
+    if not trace:
+        return _worker_reader._read_page(img), []
+    with tracer.collect() as records:
+        df = _worker_reader._read_page(img)
+    return df, records
+
+
 class TableReader(TableReaderInterface):
 
     def __init__(self,
                  cell_extractor: CellsExtractorInterface = CellsExtractor(),
-                 cell_reader: CellsReaderInterface = CellsReader(model='easyocr', lang=['ru', 'en'])):
+                 cell_reader: CellsReaderInterface = CellsReader(model='easyocr', lang=['ru', 'en']),
+                 max_workers: int = 1,
+                 document_cache: DocumentCache = None,
+                 method: str = 'scan',
+                 pages_per_batch: int = 8):
+        """
+        max_workers -- number of processes for pages of pdf, if None, then number of cores is used
+        document_cache -- if given, then table of already read file is taken from cache
+        method -- method of cells reader, 'simple' or 'scan'
+        pages_per_batch -- number of pdf pages which cells are read together, if cells reader can do it
+        (batched simple method), then recognizer get fuller batches of cells with similar size,
+        otherwise pages are read one by one
+        """
         self.cell_extractor = cell_extractor
         self.cell_reader = cell_reader
+        self.method = method
+        self.pages_per_batch = pages_per_batch
+        self.max_workers = max_workers if max_workers is not None else os.cpu_count()
+        self.document_cache = document_cache
+        self.__executor = None
 
-    def read_pdf(self, pdf: bytes):
-        pages = convert_from_bytes(pdf)
-        df_list = []
-        for page in pages:
-            img = np.array(page)
-            align_im = align_image(img)
-            columns_list = self.cell_extractor.extract_cells(img)
-            table = self.cell_reader.read_cells(columns_list, align_im, method='scan')
-            df = _list_to_pandas(table)
-            df_list.append(df)
-        res_df = pd.DataFrame()
-        for df in df_list:
-            res_df = pd.concat([res_df, df], ignore_index=True)
-        return res_df
-
-    def read_image(self, img: list):
-        align_im = align_image(img)
-        columns_list = self.cell_extractor.extract_cells(img)
-        table = self.cell_reader.read_cells(columns_list, align_im, method='scan')
-        df = _list_to_pandas(table)
+    def __get_executor(self) -> ProcessPoolExecutor:
+        """
+        This method create process pool on first use, then the pool with loaded models is reused
+        """
+        if self.__executor is None:
+            n_threads = max(1, os.cpu_count() // self.max_workers)
+            self.__executor = ProcessPoolExecutor(max_workers=self.max_workers,
+                                                  mp_context=multiprocessing.get_context('spawn'),
+                                                  initializer=_init_worker,
+                                                  initargs=(self.cell_extractor, self.cell_reader, n_threads,
+                                                            self.method))
+        return self.__executor
+
+    def close(self):
+        """
+        This method stop worker processes
+        """
+        if self.__executor is not None:
+            self.__executor.shutdown(cancel_futures=True)
+            self.__executor = None
+
+    def _read_page(self, img: np.array) -> pd.DataFrame:
+        """
+        This method align page once and share it between cells extractor and cells reader
+        """
+        with tracer.span('page') as span:
+            page = self.cell_extractor.prepare_page(img)
+            grid = self.cell_extractor.extract_cells(page)
+            span.count(cells=grid.n_cols * grid.n_rows)
+            table = self.cell_reader.read_cells(grid, page, method=self.method)
+            with tracer.span('dataframe'):
+                df = _list_to_pandas(table, typed=False)
+        return df
+
+    def _read_pages(self, imgs: list) -> list:
+        """
+        This method find cells on every page and then read cells of all pages together
+        """
+        items = []
+        for img in imgs:
+            with tracer.span('page') as span:
+                page = self.cell_extractor.prepare_page(img)
+                grid = self.cell_extractor.extract_cells(page)
+                span.count(cells=grid.n_cols * grid.n_rows)
+            items.append((grid, page))
+
+        tables = self.cell_reader.read_cells_many(items, method=self.method)
+        with tracer.span('dataframe'):
+            return [_list_to_pandas(table, typed=False) for table in tables]
+
+    def __iter_pdf_parallel(self, pdf: bytes, on_open: callable = None):
+        """
+        This generator send pages to worker processes and yield DataFrames in order of pages
+        """
+        executor = self.__get_executor()
+        futures = deque()
+
+        def result():
+            df, records = futures.popleft().result()
+            for record in records:
+                tracer.emit(record)
+            return df
+
+        try:
+            for img in _iter_pdf_pages(pdf, on_open):
+                futures.append(executor.submit(_read_page_in_worker, img, tracer.enabled))
+                # bound number of rendered pages which wait for processing
+                if len(futures) >= 2 * self.max_workers:
+                    yield result()
+            while futures:
+                yield result()
+        finally:
+            for future in futures:
+                future.cancel()
+
+    def __iter_pdf_tables(self, pdf: bytes, on_open: callable = None):
+        if self.max_workers > 1:
+            yield from self.__iter_pdf_parallel(pdf, on_open)
+            return
+
+        # window of pages is collected only if reader share work between them,
+        # otherwise every page is read as soon as it is rendered, so memory is flat and progress is smooth
+        if self.pages_per_batch <= 1 or not self.cell_reader.reads_pages_together(self.method):
+            for img in _iter_pdf_pages(pdf, on_open):
+                yield self._read_page(img)
+            return
+
+        window = []
+        for img in _iter_pdf_pages(pdf, on_open):
+            window.append(img)
+            if len(window) >= self.pages_per_batch:
+                yield from self._read_pages(window)
+                window = []
+        if window:
+            yield from self._read_pages(window)
+
+    def iter_pdf(self, pdf: bytes, progress: callable = None, typed: bool = True):
+        """
+        This generator read pdf page by page and yield DataFrame of each page as soon as it is ready,
+        progress is called after every page with number of read pages, number of pages and number of read cells,
+        if typed is True, then types of columns are inferred for every page
+        """
+        n_pages = [None]
+
+        def on_open(n):
+            n_pages[0] = n
+
+        cells = 0
+        for number, df in enumerate(self.__iter_pdf_tables(pdf, on_open), 1):
+            cells += _count_cells(df)
+            if progress is not None:
+                progress(number, n_pages[0], cells)
+            if typed:
+                with tracer.span('dataframe'):
+                    df = infer_types(df)
+            yield df
+
+    def read_pdf(self, pdf: bytes, progress: callable = None):
+        # types are inferred once for the whole document, pages can disagree about types of columns
+        df_list = list(self.iter_pdf(pdf, progress=progress, typed=False))
+        if len(df_list) == 0:
+            return pd.DataFrame()
+        # concatenate once, concatenation in loop is quadratic in the number of pages
+        res_df = pd.concat(df_list, ignore_index=True)
+        with tracer.span('dataframe'):
+            return infer_types(res_df)
+
+    def read_image(self, img: list, progress: callable = None):
+        df = self._read_page(img)
+        with tracer.span('dataframe'):
+            df = infer_types(df)
+        if progress is not None:
+            progress(1, 1, _count_cells(df))
         return df
 
-    def read(self, file: list or bytes, is_pdf=False):
+    def read(self, file: list or bytes, is_pdf=False, stream=False, progress: callable = None):
+        """
+        This method read table from pdf or image,
+        if stream is True, then return generator which yield DataFrame of each page,
+        progress is called after every page with number of read pages, number of pages and number of read cells
+        """
+        key = None
+        if self.document_cache is not None:
+            # result of the pipeline depends on file and on settings of the pipeline
+            config = f'{_describe(self.cell_extractor)}|{_describe(self.cell_reader)}|{self.method}|{is_pdf}'
+            with tracer.span('document_cache') as span:
+                key = self.document_cache.key(file, config)
+                df = self.document_cache.get(key)
+                span.count(cache_hits=int(df is not None))
+            if df is not None:
+                if progress is not None:
+                    progress(1, 1, _count_cells(df))
+                return iter([df]) if stream else df
+
+        if stream:
+            if is_pdf:
+                return self.iter_pdf(file, progress=progress)
+            return (self.read_image(img, progress=progress) for img in [file])
+
         if is_pdf:
-            df = self.read_pdf(file)
+            df = self.read_pdf(file, progress=progress)
         else:
-            df = self.read_image(file)
+            df = self.read_image(file, progress=progress)
+
+        if key is not None:
+            self.document_cache.put(key, df)
         return df
@@ -0,0 +1,195 @@
+import hashlib
+import os
+import pickle
+import shutil
+import tempfile
+import weakref
+from collections import OrderedDict
+
+import pandas as pd
+
+
+def fingerprint(df: pd.DataFrame) -> str:
+    """
+    This function return digest of content of table: names and types of columns and all values
+    """
+    h = hashlib.blake2b(digest_size=16)
+    h.update(repr([(str(name), str(dtype)) for name, dtype in df.dtypes.items()]).encode())
+    h.update(str(df.shape).encode())
+    if df.size > 0:
+        h.update(pd.util.hash_pandas_object(df, index=True).to_numpy().tobytes())
+    return h.hexdigest()
+
+
+class _Entry:
+    __slots__ = ('name', 'fingerprint', 'df', 'path', 'columns', 'attrs', 'nbytes')
+
+    def __init__(self, name: str, fingerprint: str, df: pd.DataFrame):
+        self.name = name
+        self.fingerprint = fingerprint
+        self.df = df
+        self.path = None
+        self.columns = df.columns
+        self.attrs = df.attrs
+        self.nbytes = int(df.memory_usage(index=True, deep=True).sum())
+
+
+class TableRegistry:
+    """
+    This class keep tables of session by id, tables with the same name and content (fingerprint) are kept once.
+    If tables take more than max_bytes of memory, the least recently used tables are written to disk
+    (parquet, or pickle if table can't be written to parquet) and read again on use
+    """
+
+    def __init__(self, max_bytes: int = 256 * 2 ** 20, directory: str = None):
+        """
+        directory -- parent directory for spilled tables, if None, then temporary directory of system is used
+        """
+        self.max_bytes = max_bytes
+        self.directory = directory
+        self.__entries = OrderedDict()
+        self.__by_key = {}
+        self.__order = []
+        self.__next_id = 0
+        self.__memory = 0
+        self.__spill_dir = None
+
+    def __len__(self) -> int:
+        return len(self.__entries)
+
+    def __contains__(self, table_id: int) -> bool:
+        return table_id in self.__entries
+
+    def items(self) -> list:
+        """
+        This method return list of (id, name) in order of adding
+        """
+        return [(table_id, self.__entries[table_id].name) for table_id in self.__order]
+
+    def find(self, name: str, df: pd.DataFrame) -> int or None:
+        return self.__by_key.get((name, fingerprint(df)))
+
+    def add(self, name: str, df: pd.DataFrame) -> tuple:
+        """
+        This method add table, return id of table and True if table is new,
+        if the same table is already in registry, then return its id and False
+        """
+        fp = fingerprint(df)
+        if (table_id := self.__by_key.get((name, fp))) is not None:
+            return table_id, False
+
+        table_id = self.__next_id
+        self.__next_id += 1
+        self.__entries[table_id] = _Entry(name, fp, df)
+        self.__by_key[(name, fp)] = table_id
+        self.__order.append(table_id)
+        self.__memory += self.__entries[table_id].nbytes
+        self.__spill(keep=table_id)
+        return table_id, True
+
+    def name(self, table_id: int) -> str:
+        return self.__entries[table_id].name
+
+    def fingerprint(self, table_id: int) -> str:
+        return self.__entries[table_id].fingerprint
+
+    def get(self, table_id: int) -> pd.DataFrame:
+        entry = self.__entries[table_id]
+        self.__entries.move_to_end(table_id)
+        if entry.df is None:
+            entry.df = self.__load(entry)
+            self.__memory += entry.nbytes
+            self.__spill(keep=table_id)
+        return entry.df
+
+    def update(self, table_id: int, df: pd.DataFrame) -> str:
+        """
+        This method replace table after editing, return new fingerprint
+        """
+        entry = self.__entries[table_id]
+        fp = fingerprint(df)
+        if self.__by_key.get((entry.name, entry.fingerprint)) == table_id:
+            del self.__by_key[(entry.name, entry.fingerprint)]
+        # if edited table is equal to other table, then it is still found by the first id
+        self.__by_key.setdefault((entry.name, fp), table_id)
+
+        if entry.df is not None:
+            self.__memory -= entry.nbytes
+        self.__remove_file(entry)
+        new_entry = _Entry(entry.name, fp, df)
+        self.__entries[table_id] = new_entry
+        self.__entries.move_to_end(table_id)
+        self.__memory += new_entry.nbytes
+        self.__spill(keep=table_id)
+        return fp
+
+    def remove(self, table_id: int):
+        entry = self.__entries.pop(table_id)
+        self.__order.remove(table_id)
+        if self.__by_key.get((entry.name, entry.fingerprint)) == table_id:
+            del self.__by_key[(entry.name, entry.fingerprint)]
+        if entry.df is not None:
+            self.__memory -= entry.nbytes
+        self.__remove_file(entry)
+
+    def stats(self) -> dict:
+        return {'tables': len(self.__entries), 'memory_bytes': self.__memory,
+                'spilled': sum(entry.df is None for entry in self.__entries.values())}
+
+    def __get_spill_dir(self) -> str:
+        if self.__spill_dir is None:
+            if self.directory is not None:
+                os.makedirs(self.directory, exist_ok=True)
+            self.__spill_dir = tempfile.mkdtemp(prefix='tables-', dir=self.directory)
+            # files of the registry are removed together with registry
+            weakref.finalize(self, shutil.rmtree, self.__spill_dir, True)
+        return self.__spill_dir
+
+    def __spill(self, keep: int):
+        """
+        This method write the least recently used tables to disk until tables in memory take less than max_bytes
+        """
+        for table_id, entry in self.__entries.items():
+            if self.__memory <= self.max_bytes:
+                break
+            if table_id == keep or entry.df is None:
+                continue
+            self.__dump(table_id, entry)
+            entry.df = None
+            self.__memory -= entry.nbytes
+
+    def __dump(self, table_id: int, entry: _Entry):
+        if entry.path is not None and os.path.exists(entry.path):
+            # table wasn't changed after loading, file is actual
+            return
+        # tables with the same content and different names have own files, so removing of one keep other
+        path = os.path.join(self.__get_spill_dir(), f'{table_id}-{entry.fingerprint}')
+        try:
+            # parquet need string names of columns, original names are restored on loading
+            df = entry.df.copy(deep=False)
+            df.columns = [str(i) for i in range(len(df.columns))]
+            df.to_parquet(f'{path}.parquet', index=True)
+            entry.path = f'{path}.parquet'
+        except (ImportError, ValueError, TypeError, NotImplementedError, OverflowError):
+            # columns with mixed types of values can't be written to parquet
+            if os.path.exists(f'{path}.parquet'):
+                os.remove(f'{path}.parquet')
+            with open(f'{path}.pkl', 'wb') as f:
+                pickle.dump(entry.df, f, protocol=pickle.HIGHEST_PROTOCOL)
+            entry.path = f'{path}.pkl'
+
+    def __load(self, entry: _Entry) -> pd.DataFrame:
+        if entry.path.endswith('.pkl'):
+            with open(entry.path, 'rb') as f:
+                return pickle.load(f)
+        df = pd.read_parquet(entry.path)
+        df.columns = entry.columns
+        # attrs (like not parsed cells) aren't kept by parquet
+        df.attrs = entry.attrs
+        return df
+
+    @staticmethod
+    def __remove_file(entry: _Entry):
+        if entry.path is not None and os.path.exists(entry.path):
+            os.remove(entry.path)
+        entry.path = None
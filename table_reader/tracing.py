@@ -0,0 +1,206 @@
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+
+class _NullSpan:
+    """
+    This class is returned when tracing is disabled, so spans in the pipeline cost almost nothing
+    """
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        return False
+
+    def count(self, **counts):
+        pass
+
+
+_NULL_SPAN = _NullSpan()
+
+
+class Span:
+    """
+    This class measure wall time of one stage of the pipeline and keep counts of processed objects
+    """
+    __slots__ = ('tracer', 'name', 'counts', 'time', 'start', 'seconds')
+
+    def __init__(self, tracer: 'Tracer', name: str, counts: dict):
+        self.tracer = tracer
+        self.name = name
+        self.counts = counts
+        self.time = None
+        self.start = None
+        self.seconds = None
+
+    def __enter__(self):
+        self.tracer._push(self)
+        self.time = time.time()
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.seconds = time.perf_counter() - self.start
+        self.tracer._pop(self)
+        self.tracer.record(self)
+        return False
+
+    def count(self, **counts):
+        for name, value in counts.items():
+            self.counts[name] = self.counts.get(name, 0) + value
+
+
+class JsonLinesLogger:
+    """
+    This observer write every record of span as one JSON line in file
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.__lock = threading.Lock()
+        self.__file = open(path, 'a', encoding='utf-8')
+
+    def __call__(self, record: dict):
+        line = json.dumps(record, ensure_ascii=False)
+        with self.__lock:
+            self.__file.write(line + '\n')
+            self.__file.flush()
+
+    def close(self):
+        with self.__lock:
+            self.__file.close()
+
+
+class Tracer:
+    """
+    This class send records of spans of the pipeline stages to observers,
+    observer is any callable which take record -- dict with name, time, seconds, counts and pid.
+    Observers added by add_observer get spans of all threads,
+    lists given by collect get spans of the thread which called collect only
+    """
+
+    def __init__(self):
+        self.enabled = False
+        self.__observers = []
+        self.__collecting = 0
+        self.__lock = threading.Lock()
+        self.__local = threading.local()
+
+    def __update(self):
+        self.enabled = len(self.__observers) > 0 or self.__collecting > 0
+
+    def add_observer(self, observer: callable):
+        with self.__lock:
+            self.__observers = self.__observers + [observer]
+            self.__update()
+
+    def remove_observer(self, observer: callable):
+        with self.__lock:
+            self.__observers = [o for o in self.__observers if o is not observer]
+            self.__update()
+
+    def reset(self):
+        """
+        This method remove all observers
+        """
+        with self.__lock:
+            self.__observers = []
+            self.__update()
+
+    @contextmanager
+    def observe(self, observer: callable):
+        self.add_observer(observer)
+        try:
+            yield observer
+        finally:
+            self.remove_observer(observer)
+
+    def span(self, name: str, **counts):
+        if not self.enabled:
+            return _NULL_SPAN
+        return Span(self, name, counts)
+
+    def __stack(self) -> list:
+        stack = getattr(self.__local, 'stack', None)
+        if stack is None:
+            stack = self.__local.stack = []
+        return stack
+
+    def _push(self, span: Span):
+        self.__stack().append(span)
+
+    def _pop(self, span: Span):
+        stack = self.__stack()
+        if stack and stack[-1] is span:
+            stack.pop()
+
+    def count(self, **counts):
+        """
+        This method add counts to the innermost open span of the current thread
+        """
+        if not self.enabled:
+            return
+        stack = self.__stack()
+        if stack:
+            stack[-1].count(**counts)
+
+    def record(self, span: Span):
+        self.emit({'name': span.name, 'time': span.time, 'seconds': span.seconds,
+                   'counts': dict(span.counts), 'pid': os.getpid()})
+
+    def emit(self, record: dict):
+        """
+        This method send ready record to observers, it is used for records made in other processes too
+        """
+        for observer in self.__observers:
+            observer(record)
+        for records in getattr(self.__local, 'collectors', ()):
+            records.append(record)
+
+    @contextmanager
+    def collect(self):
+        """
+        This context manager enable tracing and give list where records of spans of the current thread are collected
+        """
+        records = []
+        collectors = getattr(self.__local, 'collectors', None)
+        if collectors is None:
+            collectors = self.__local.collectors = []
+        collectors.append(records)
+        with self.__lock:
+            self.__collecting += 1
+            self.__update()
+        try:
+            yield records
+        finally:
+            collectors.remove(records)
+            with self.__lock:
+                self.__collecting -= 1
+                self.__update()
+
+
+def summarize(records: list) -> list:
+    """
+    This function sum time, calls and counts of records with the same name,
+    return list of dicts in order of first appearance of the stage
+    """
+    stages = {}
+    for record in records:
+        stage = stages.setdefault(record['name'], {'stage': record['name'], 'calls': 0, 'seconds': 0.0})
+        stage['calls'] += 1
+        stage['seconds'] += record['seconds']
+        for name, value in record['counts'].items():
+            stage[name] = stage.get(name, 0) + value
+    return list(stages.values())
+
+
+# tracer of the pipeline
+tracer = Tracer()
+
+# spans are written to JSON lines file, if path of the file is given in environment
+if os.environ.get('TABLE_READER_TRACE'):
+    tracer.add_observer(JsonLinesLogger(os.environ['TABLE_READER_TRACE']))